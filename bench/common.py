@@ -0,0 +1,105 @@
+"""Shared setup for the benchmarks: the API on a throwaway SQLite file, seeded in bulk.
+
+Run a benchmark from the repository root, e.g. ``python -m bench.ledger_latency``.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from src.models.user import db, User, Student, Item, Transaction, Purchase, TeacherStats
+from src.models.migrations import upgrade_database
+from src.auth import init_login_manager
+from src.events import init_events
+from src.passwords import init_password_hasher
+from src.routes.auth import auth_bp
+from src.routes.teacher import teacher_bp
+from src.routes.student import student_bp
+from src.sqlite_tuning import init_sqlite_tuning
+
+INSERT_BATCH_SIZE = 10000
+
+def create_app(directory=None, **config):
+    """The API wired up like src.main on a new database file in ``directory`` (a temp dir by default)"""
+    directory = directory or tempfile.mkdtemp(prefix='bench-')
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='bench',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'app.db')}",
+        UPLOAD_FOLDER=os.path.join(directory, 'uploads'),
+        UPLOAD_TMP_FOLDER=os.path.join(directory, 'upload-tmp'),
+        IDENTITY_CACHE_TTL=30,
+        PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',  # logins aren't what is measured
+        PASSWORD_HASH_WORKERS=0,
+    )
+    app.config.update(config)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['UPLOAD_TMP_FOLDER'], exist_ok=True)
+    init_login_manager(app)
+    init_password_hasher(app)
+    init_events(app)
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(teacher_bp, url_prefix='/api/teacher')
+    app.register_blueprint(student_bp, url_prefix='/api/student')
+    db.init_app(app)
+    init_sqlite_tuning(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_database()
+    return app
+
+def seed_class(app, students=30, items=20, transactions=0, purchases=0, balance=100000, username='teacher'):
+    """Create a teacher with a class, a store and a random ledger; returns the students' student_ids"""
+    rng = random.Random(1)
+    with app.app_context():
+        teacher = User(username=username, role='teacher')
+        teacher.set_password('password')
+        db.session.add(teacher)
+        db.session.flush()
+        student_rows = db.session.scalars(db.insert(Student).returning(Student.id), [
+            {'name': f'Student {n}', 'student_id': f'{username}-{n}', 'balance': balance, 'teacher_id': teacher.id}
+            for n in range(students)
+        ]).all()
+        item_rows = db.session.scalars(db.insert(Item).returning(Item.id), [
+            {'name': f'Item {n}', 'price': rng.randint(50, 500), 'teacher_id': teacher.id} for n in range(items)
+        ]).all()
+        start = datetime.utcnow() - timedelta(days=365)
+        for offset in range(0, transactions, INSERT_BATCH_SIZE):
+            db.session.execute(db.insert(Transaction), [
+                {'student_id': rng.choice(student_rows), 'type': rng.choice(('credit', 'debit')),
+                 'amount': rng.randint(1, 1000), 'description': 'Seeded', 'balance_after': balance,
+                 'created_at': start + timedelta(seconds=n * 60)}
+                for n in range(offset, min(offset + INSERT_BATCH_SIZE, transactions))
+            ])
+        for offset in range(0, purchases, INSERT_BATCH_SIZE):
+            db.session.execute(db.insert(Purchase), [
+                {'student_id': rng.choice(student_rows), 'item_id': rng.choice(item_rows), 'quantity': 1,
+                 'total_amount': rng.randint(50, 500), 'created_at': start + timedelta(seconds=n * 60)}
+                for n in range(offset, min(offset + INSERT_BATCH_SIZE, purchases))
+            ])
+        TeacherStats.rebuild()
+        db.session.commit()
+    return [f'{username}-{n}' for n in range(students)]
+
+def teacher_client(app, username='teacher'):
+    client = app.test_client()
+    assert client.post('/api/auth/login', json={'username': username, 'password': 'password'}).status_code == 200
+    return client
+
+def student_client(app, student_id):
+    client = app.test_client()
+    assert client.post('/api/auth/login', json={'student_id': student_id}).status_code == 200
+    return client
+
+def time_request(client, path, repeat=20):
+    """Mean milliseconds of ``repeat`` fresh (non-304) GETs of ``path``"""
+    client.get(path)  # warm up caches and the connection pool
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, (path, response.status_code)
+    return statistics.mean(samples)
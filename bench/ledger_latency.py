@@ -0,0 +1,36 @@
+"""Dashboard and history latency as a class's ledger grows.
+
+With the (student_id, created_at) and teacher_id indexes, every endpoint
+below should stay roughly flat from a few thousand to 100k+ ledger rows.
+
+    python -m bench.ledger_latency [--sizes 1000 10000 100000 150000]
+"""
+import argparse
+from bench.common import create_app, seed_class, teacher_client, student_client, time_request
+
+ENDPOINTS = [
+    ('teacher', '/api/teacher/dashboard'),
+    ('teacher', '/api/teacher/summary'),
+    ('student', '/api/student/dashboard'),
+    ('student', '/api/student/transactions'),
+    ('student', '/api/student/purchases'),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 150000],
+                        help='Ledger rows per run; three quarters transactions, one quarter purchases.')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print('Mean latency in ms')
+    print(f'{"ledger rows":>12}  ' + '  '.join(f'{path:>27}' for _, path in ENDPOINTS))
+    for size in args.sizes:
+        app = create_app()
+        student_ids = seed_class(app, transactions=size * 3 // 4, purchases=size // 4)
+        clients = {'teacher': teacher_client(app), 'student': student_client(app, student_ids[0])}
+        timings = [time_request(clients[role], path, args.repeat) for role, path in ENDPOINTS]
+        print(f'{size:>12}  ' + '  '.join(f'{mean:>27.2f}' for mean in timings))
+
+if __name__ == '__main__':
+    main()
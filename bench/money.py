@@ -0,0 +1,73 @@
+"""Money handling: Numeric columns with Decimal round trips (before) against integer cents (after).
+
+The conversion and serialization parts run both representations side by
+side; purchase throughput is measured on the current tree.
+
+    python -m bench.money [--rows 10000] [--purchases 300]
+"""
+import argparse
+import time
+import timeit
+from decimal import Decimal, ROUND_HALF_UP
+import sqlalchemy as sa
+from src.models.user import Cents, cents_to_float
+from bench.common import create_app, seed_class, student_client
+
+def quantize(value):
+    """How the routes used to normalize a Numeric value before doing arithmetic with it"""
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+def conversion(number):
+    """Microseconds to turn one stored amount into a JSON float, before and after"""
+    stored_decimal, stored_cents = Decimal('12.34'), 1234
+    before = timeit.timeit(lambda: float(quantize(stored_decimal)), number=number)
+    after = timeit.timeit(lambda: cents_to_float(stored_cents), number=number)
+    return before / number * 1e6, after / number * 1e6
+
+def serialization(rows):
+    """Best-of-5 milliseconds to load ``rows`` ledger rows and convert their two money columns, before and after"""
+    engine = sa.create_engine('sqlite://')
+    metadata = sa.MetaData()
+    tables = {}
+    for name, money_type in (('before', sa.Numeric(10, 2)), ('after', Cents)):
+        tables[name] = sa.Table(f'ledger_{name}', metadata, sa.Column('id', sa.Integer, primary_key=True),
+                                sa.Column('amount', money_type), sa.Column('balance_after', money_type))
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(tables['before'].insert(), [{'amount': n % 1000 / 100, 'balance_after': n / 100} for n in range(rows)])
+        conn.execute(tables['after'].insert(), [{'amount': n % 1000, 'balance_after': n} for n in range(rows)])
+    timings = {'before': [], 'after': []}
+    with engine.connect() as conn:
+        for _ in range(5):
+            for name, to_float in (('before', float), ('after', cents_to_float)):
+                started = time.perf_counter()
+                [{'amount': to_float(row.amount), 'balance_after': to_float(row.balance_after)}
+                 for row in conn.execute(sa.select(tables[name]))]
+                timings[name].append((time.perf_counter() - started) * 1000)
+    return min(timings['before']), min(timings['after'])
+
+def purchase_throughput(purchases):
+    """Add-to-cart plus checkout round trips per second for one student"""
+    app = create_app()
+    student = student_client(app, seed_class(app, students=1, items=1, balance=10 ** 9)[0])
+    item_id = student.get('/api/student/store').get_json()['items'][0]['id']
+    started = time.perf_counter()
+    for _ in range(purchases):
+        student.post('/api/student/cart', json={'item_id': item_id, 'quantity': 1})
+        assert student.post('/api/student/purchase').status_code == 200
+    return purchases / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--purchases', type=int, default=300)
+    args = parser.parse_args()
+
+    before, after = conversion(100000)
+    print(f'one amount to JSON float:    {before:8.2f} us before  {after:8.2f} us after')
+    before, after = serialization(args.rows)
+    print(f'{args.rows} ledger rows to floats: {before:8.2f} ms before  {after:8.2f} ms after')
+    print(f'checkout throughput:         {purchase_throughput(args.purchases):8.1f} purchases/s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Read and write throughput with SQLite's default pragmas against the tuning profile.
+
+Reader threads fetch student dashboards while writer threads check out,
+all against one database file, first with SQLITE_PRAGMAS = {} and then
+with DEFAULT_SQLITE_PRAGMAS (foreign_keys is on in both).
+
+    python -m bench.sqlite_profile [--seconds 5] [--readers 8] [--writers 8]
+"""
+import argparse
+import threading
+import time
+from src.sqlite_tuning import DEFAULT_SQLITE_PRAGMAS
+from bench.common import create_app, seed_class, student_client
+
+def run(pragmas, seconds, readers, writers):
+    """Return (dashboard reads, purchases, failed requests) completed in ``seconds``"""
+    app = create_app(SQLITE_PRAGMAS=pragmas)
+    student_ids = seed_class(app, students=readers + writers, transactions=20000, purchases=5000)
+    clients = [student_client(app, student_id) for student_id in student_ids]
+    item_id = clients[0].get('/api/student/store').get_json()['items'][0]['id']
+    counts = {'reads': 0, 'purchases': 0, 'failed': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def count(name):
+        with lock:
+            counts[name] += 1
+
+    def read(client):
+        while not stop.is_set():
+            count('reads' if client.get('/api/student/dashboard').status_code == 200 else 'failed')
+
+    def write(client):
+        while not stop.is_set():
+            client.post('/api/student/cart', json={'item_id': item_id, 'quantity': 1})
+            count('purchases' if client.post('/api/student/purchase').status_code == 200 else 'failed')
+
+    threads = [threading.Thread(target=read, args=(client,)) for client in clients[:readers]]
+    threads += [threading.Thread(target=write, args=(client,)) for client in clients[readers:]]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts['reads'], counts['purchases'], counts['failed']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=8)
+    args = parser.parse_args()
+
+    for label, pragmas in (('SQLite defaults', {}), ('tuning profile', DEFAULT_SQLITE_PRAGMAS)):
+        reads, purchases, failed = run(pragmas, args.seconds, args.readers, args.writers)
+        print(f'{label:>16}: {reads / args.seconds:8.1f} reads/s  {purchases / args.seconds:8.1f} purchases/s  '
+              f'{failed} failed requests')
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,77 @@
-from flask_login import LoginManager
-from src.models.user import User, Student
+from collections import namedtuple
+from flask import g
+from flask_login import LoginManager, UserMixin
+from src.cache import TTLCache
+from src.models.user import db, User, Student
 
 login_manager = LoginManager()
 
+# Lightweight identity records shared across requests. Entries expire after
+# IDENTITY_CACHE_TTL seconds and are dropped as soon as the underlying
+# student or teacher is updated or deleted in this process.
+identity_cache = TTLCache()
+
+StudentIdentity = namedtuple('StudentIdentity', ['id', 'student_id', 'name', 'teacher_id'])
+
+class TeacherIdentity(UserMixin):
+    """Detached stand-in for User used as Flask-Login's current_user"""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+        self.created_at = user.created_at
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'role': self.role,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    key = ('teacher', int(user_id))
+    identity = identity_cache.get(key)
+    if identity is None:
+        user = db.session.get(User, int(user_id))
+        if user is None:
+            return None
+        identity = TeacherIdentity(user)
+        identity_cache.set(key, identity)
+    return identity
 
 def load_student(student_id):
     """Load student by student_id for student authentication"""
     return Student.query.filter_by(student_id=student_id).first()
 
+def load_student_identity(student_pk):
+    """Identity of a logged-in student, memoized per request and cached across requests"""
+    if 'student_identity' in g:
+        return g.student_identity
+    key = ('student', student_pk)
+    identity = identity_cache.get(key)
+    if identity is None:
+        student = db.session.get(Student, student_pk)
+        if student is not None:
+            identity = StudentIdentity(student.id, student.student_id, student.name, student.teacher_id)
+            identity_cache.set(key, identity)
+    g.student_identity = identity
+    return identity
+
+def invalidate_student(student_pk):
+    identity_cache.pop(('student', student_pk))
+    g.pop('student_identity', None)
+
+def invalidate_teacher(user_id):
+    identity_cache.pop(('teacher', user_id))
+
 def init_login_manager(app):
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
-
+    identity_cache.configure(
+        maxsize=app.config.get('IDENTITY_CACHE_SIZE', 1024),
+        ttl=app.config.get('IDENTITY_CACHE_TTL', 30)
+    )
@@ -0,0 +1,63 @@
+import click
+from flask.cli import with_appcontext
+from src.models.user import db, TeacherStats, format_cents
+from src.models.migrations import backfill_balance_after
+from src.payouts import run_due_payouts
+from src.ledger_export import FORMATS, export_cursor, export_ledger
+from src.uploads import sweep_uploads
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Recompute every teacher's dashboard totals from scratch."""
+    count = TeacherStats.rebuild()
+    db.session.commit()
+    click.echo(f'Rebuilt dashboard totals for {count} teacher(s).')
+
+@click.command('backfill-balances')
+@with_appcontext
+def backfill_balances_command():
+    """Fill in the running balance on ledger rows that are missing it."""
+    with db.engine.begin() as conn:
+        count = backfill_balance_after(conn)
+    click.echo(f'Backfilled running balances on {count} transaction(s).')
+
+@click.command('run-payouts')
+@with_appcontext
+def run_payouts_command():
+    """Pay every recurring payout that is due (safe to run from cron)."""
+    runs = run_due_payouts()
+    for run in runs:
+        click.echo(f'Payout {run.payout_id}: paid {run.students_paid} student(s) '
+                   f'${format_cents(run.total_amount)} in {run.duration_ms} ms.')
+    click.echo(f'Ran {len(runs)} payout(s).')
+
+@click.command('export-ledger')
+@click.option('--transaction-after', default=0, help='Last transaction id already exported.')
+@click.option('--purchase-after', default=0, help='Last purchase id already exported.')
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv')
+@click.option('--output', type=click.File('wb'), default='-', help='Where to write the .gz (default stdout).')
+@with_appcontext
+def export_ledger_command(transaction_after, purchase_after, fmt, output):
+    """Write every ledger row newer than the cursors as gzipped CSV or JSON Lines."""
+    since = {'transaction': transaction_after, 'purchase': purchase_after}
+    until = export_cursor()
+    for chunk in export_ledger(since, until, fmt):
+        output.write(chunk)
+    click.echo(f'Next cursor: --transaction-after {max(until["transaction"], transaction_after)} '
+               f'--purchase-after {max(until["purchase"], purchase_after)}', err=True)
+
+@click.command('sweep-uploads')
+@click.option('--grace', type=int, default=None, help='Spare files modified this many seconds ago or later.')
+@with_appcontext
+def sweep_uploads_command(grace):
+    """Delete upload files that no item references."""
+    count, reclaimed = sweep_uploads(grace)
+    click.echo(f'Removed {count} orphaned upload(s), reclaiming {reclaimed} bytes.')
+
+def init_cli(app):
+    app.cli.add_command(rebuild_stats_command)
+    app.cli.add_command(backfill_balances_command)
+    app.cli.add_command(run_payouts_command)
+    app.cli.add_command(export_ledger_command)
+    app.cli.add_command(sweep_uploads_command)
@@ -0,0 +1,28 @@
+from functools import wraps
+from flask import Response, make_response, request
+
+def conditional(etag_for_request):
+    """Serve a GET view conditionally on a cheap version lookup.
+
+    ``etag_for_request()`` returns an ETag string built from data versions
+    (or None to skip caching). When it matches If-None-Match the view is not
+    called at all and a bare 304 is returned; otherwise the view's response is
+    tagged. Place below the authentication decorator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = etag_for_request()
+            if etag is None:
+                return f(*args, **kwargs)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,157 @@
+import json
+import queue
+import threading
+from flask import Response
+from sqlalchemy import event
+from src.models.user import db
+
+def student_channel(student_id):
+    """Events for one student: their balance and new transactions"""
+    return f'student:{student_id}'
+
+def teacher_channel(teacher_id):
+    """Events for one teacher: balance changes of any of their students"""
+    return f'teacher:{teacher_id}'
+
+def class_channel(teacher_id):
+    """Events for a teacher and all of their students: store catalog changes"""
+    return f'class:{teacher_id}'
+
+class Subscription:
+    """One open event stream: a bounded queue registered under several channels"""
+
+    def __init__(self, channels, max_queued):
+        self.channels = tuple(channels)
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.overflowed = False
+
+class EventBroker:
+    """In-process fan-out of committed changes to open event streams.
+
+    Publishing is a dict lookup plus a non-blocking put per subscriber, so
+    idle streams cost nothing but their queue. A subscriber that falls
+    ``max_queued`` events behind is disconnected instead of buffering without
+    bound; EventSource reconnects and the client reloads its view.
+
+    Each open stream holds a server thread for as long as it is connected,
+    so at most ``max_streams`` are served at once; past that the client gets
+    a 503 with Retry-After and falls back to polling.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._open_streams = 0
+        self.max_queued = 100
+        self.keepalive = 15
+        self.max_streams = 50
+        self.retry_after = 30
+
+    def configure(self, max_queued, keepalive, max_streams, retry_after):
+        self.max_queued = max_queued
+        self.keepalive = keepalive
+        self.max_streams = max_streams
+        self.retry_after = retry_after
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, self.max_queued)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, name, data):
+        with self._lock:
+            subscribers = tuple(self._channels.get(channel, ()))
+        if not subscribers:
+            return
+        message = f'event: {name}\ndata: {json.dumps(data)}\n\n'
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def stream(self, channels):
+        """Build the text/event-stream response for ``channels``, or a 503 when too many are open"""
+        with self._lock:
+            if self.max_streams and self._open_streams >= self.max_streams:
+                response = Response(json.dumps({'error': 'Too many live update streams; poll instead'}),
+                                    status=503, mimetype='application/json')
+                response.headers['Retry-After'] = str(self.retry_after)
+                return response
+            self._open_streams += 1
+        subscription = self.subscribe(channels)
+        keepalive = self.keepalive
+        released = threading.Event()
+
+        def release():
+            # Runs from the generator and from response.close(); whichever comes first frees the slot
+            with self._lock:
+                if released.is_set():
+                    return
+                released.set()
+                self._open_streams -= 1
+            self.unsubscribe(subscription)
+
+        def generate():
+            try:
+                yield 'retry: 3000\n\n'
+                while not subscription.overflowed:
+                    try:
+                        yield subscription.queue.get(timeout=keepalive)
+                    except queue.Empty:
+                        # Comment line: keeps proxies from timing out and detects closed clients
+                        yield ': keepalive\n\n'
+            finally:
+                release()
+
+        response = Response(generate(), mimetype='text/event-stream')
+        response.call_on_close(release)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+broker = EventBroker()
+
+def publish_after_commit(channels, name, data):
+    """Queue an event on the current session; it is sent only if the session commits"""
+    db.session.info.setdefault('pending_events', []).extend(
+        (channel, name, data) for channel in channels
+    )
+
+def publish_balance(student_id, teacher_id, balance, transaction):
+    """Announce a student's new balance and the transaction that produced it"""
+    publish_after_commit(
+        [student_channel(student_id), teacher_channel(teacher_id)],
+        'balance',
+        {'student_id': student_id, 'balance': balance, 'transaction': transaction}
+    )
+
+def publish_item(teacher_id, action, item):
+    """Announce an added, updated or deleted store item"""
+    publish_after_commit([class_channel(teacher_id)], 'item', {'action': action, 'item': item})
+
+def _send_pending(session):
+    for channel, name, data in session.info.pop('pending_events', ()):
+        broker.publish(channel, name, data)
+
+def _drop_pending(session):
+    session.info.pop('pending_events', None)
+
+def init_events(app):
+    """Configure the broker and deliver queued events after each commit"""
+    broker.configure(app.config.get('EVENT_QUEUE_SIZE', 100), app.config.get('EVENT_KEEPALIVE', 15),
+                     app.config.get('EVENT_MAX_STREAMS', 50), app.config.get('EVENT_RETRY_AFTER', 30))
+    if not event.contains(db.session, 'after_commit', _send_pending):
+        event.listen(db.session, 'after_commit', _send_pending)
+        event.listen(db.session, 'after_rollback', _drop_pending)
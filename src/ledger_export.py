@@ -0,0 +1,87 @@
+import csv
+import gzip
+import json
+from src.models.user import db, Student, Transaction, Purchase, cents_to_float, format_cents
+from src.streaming import CHUNK_SIZE, ChunkBuffer, EchoWriter
+
+EXPORT_BATCH_SIZE = 1000  # ledger rows fetched at a time
+
+FIELDS = ['table', 'id', 'teacher_id', 'student_id', 'type', 'amount', 'description',
+          'balance_after', 'item_id', 'quantity', 'created_at']
+
+def export_cursor():
+    """The newest transaction and purchase ids: the end of an export started now"""
+    return {
+        'transaction': db.session.query(db.func.coalesce(db.func.max(Transaction.id), 0)).scalar(),
+        'purchase': db.session.query(db.func.coalesce(db.func.max(Purchase.id), 0)).scalar()
+    }
+
+def ledger_rows(since, until):
+    """Yield every ledger row with since[table] < id <= until[table], oldest first.
+
+    ``since`` and ``until`` map 'transaction' and 'purchase' to ids. Rows are
+    read with yield_per, so the export never holds more than a batch.
+    """
+    transactions = db.session.execute(
+        db.select(Transaction.id, Student.teacher_id, Transaction.student_id, Transaction.type,
+                  Transaction.amount, Transaction.description, Transaction.balance_after, Transaction.created_at)
+        .join(Student)
+        .where(Transaction.id > since['transaction'], Transaction.id <= until['transaction'])
+        .order_by(Transaction.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for id_, teacher_id, student_id, type_, amount, description, balance_after, created_at in transactions:
+        yield {'table': 'transaction', 'id': id_, 'teacher_id': teacher_id, 'student_id': student_id,
+               'type': type_, 'amount': amount, 'description': description, 'balance_after': balance_after,
+               'item_id': None, 'quantity': None, 'created_at': created_at}
+    purchases = db.session.execute(
+        db.select(Purchase.id, Student.teacher_id, Purchase.student_id, Purchase.total_amount,
+                  Purchase.item_id, Purchase.quantity, Purchase.created_at)
+        .join(Student)
+        .where(Purchase.id > since['purchase'], Purchase.id <= until['purchase'])
+        .order_by(Purchase.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for id_, teacher_id, student_id, total_amount, item_id, quantity, created_at in purchases:
+        yield {'table': 'purchase', 'id': id_, 'teacher_id': teacher_id, 'student_id': student_id,
+               'type': 'purchase', 'amount': total_amount, 'description': None, 'balance_after': None,
+               'item_id': item_id, 'quantity': quantity, 'created_at': created_at}
+
+def csv_lines(rows):
+    """Encode ledger rows as CSV with a header; money as decimal strings"""
+    writer = csv.writer(EchoWriter())
+    yield writer.writerow(FIELDS).encode('utf-8')
+    for row in rows:
+        for name in ('amount', 'balance_after'):
+            if row[name] is not None:
+                row[name] = format_cents(row[name])
+        row['created_at'] = row['created_at'].isoformat() if row['created_at'] else None
+        yield writer.writerow([row[name] for name in FIELDS]).encode('utf-8')
+
+def jsonl_lines(rows):
+    """Encode ledger rows as JSON Lines; money as floats like the API"""
+    for row in rows:
+        for name in ('amount', 'balance_after'):
+            if row[name] is not None:
+                row[name] = cents_to_float(row[name])
+        row['created_at'] = row['created_at'].isoformat() if row['created_at'] else None
+        yield (json.dumps(row) + '\n').encode('utf-8')
+
+FORMATS = {
+    'csv': csv_lines,
+    'jsonl': jsonl_lines,
+}
+
+def gzip_chunks(lines):
+    """Gzip a stream of byte strings incrementally, yielding compressed chunks"""
+    buffer = ChunkBuffer()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=6) as archive:
+        for line in lines:
+            archive.write(line)
+            if buffer.size >= CHUNK_SIZE:
+                yield buffer.drain()
+    yield buffer.drain()
+
+def export_ledger(since, until, fmt='csv'):
+    """Gzip-compressed export of the ledger rows between two cursors"""
+    return gzip_chunks(FORMATS[fmt](ledger_rows(since, until)))
@@ -3,17 +3,37 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, request
 from flask_cors import CORS
 from src.models.user import db
+from src.models.migrations import upgrade_database
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.teacher import teacher_bp
 from src.routes.student import student_bp
+from src.routes.export import export_bp
 from src.auth import init_login_manager
+from src.cli import init_cli
+from src.events import init_events
+from src.passwords import init_password_hasher
+from src.payouts import init_payouts
+from src.uploads import init_uploads
+from src.sqlite_tuning import DEFAULT_SQLITE_PRAGMAS, init_sqlite_tuning
+from src.static_assets import init_static_assets, static_assets
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+app.config['IDENTITY_CACHE_TTL'] = 30  # seconds; 0 disables the cross-request identity cache
+app.config['IDENTITY_CACHE_SIZE'] = 1024
+app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'  # new and rehashed passwords use this
+app.config['PASSWORD_HASH_WORKERS'] = 2  # max concurrent hashes; 0 hashes inline
+app.config['PASSWORD_HASH_STATS_INTERVAL'] = 300  # seconds between logged hash queue-wait summaries; 0 disables them
+app.config['EVENT_QUEUE_SIZE'] = 100  # undelivered events before a slow event stream is dropped
+app.config['EVENT_KEEPALIVE'] = 15  # seconds between keepalive comments on idle event streams
+app.config['EVENT_MAX_STREAMS'] = 50  # open event streams, each holding a server thread; 0 means no limit
+app.config['EVENT_RETRY_AFTER'] = 30  # seconds clients turned away by EVENT_MAX_STREAMS poll before retrying
+app.config['LEDGER_EXPORT_TOKEN'] = os.environ.get('LEDGER_EXPORT_TOKEN')  # bearer token for /api/export/ledger; unset disables it
+app.config['PAYOUT_POLL_INTERVAL'] = 60  # seconds between checks for due payouts; 0 leaves them to `flask run-payouts`
 
 # Enable CORS for all routes
 CORS(app)
@@ -21,40 +41,67 @@ CORS(app)
 # Initialize authentication
 init_login_manager(app)
 
+# Hash passwords on a bounded worker pool
+init_password_hasher(app)
+
+# Push committed changes to open event streams
+init_events(app)
+
+# Register `flask` CLI commands
+init_cli(app)
+
 # Register blueprints
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(teacher_bp, url_prefix='/api/teacher')
 app.register_blueprint(student_bp, url_prefix='/api/student')
+app.register_blueprint(export_bp, url_prefix='/api/export')
 
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_PRAGMAS'] = DEFAULT_SQLITE_PRAGMAS
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
+app.config['UPLOAD_TMP_FOLDER'] = os.path.join(os.path.dirname(__file__), '.upload-tmp')  # uploads being received; same filesystem as UPLOAD_FOLDER, outside static
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_IMAGE_SIZE'] = 5 * 1024 * 1024  # largest accepted item image
+app.config['UPLOAD_MAX_AGE'] = 365 * 24 * 3600  # seconds browsers may cache /uploads/ images without revalidating
+app.config['UPLOAD_SWEEP_INTERVAL'] = 24 * 3600  # seconds between orphaned-upload sweeps; 0 leaves them to `flask sweep-uploads`
+app.config['UPLOAD_SWEEP_GRACE'] = 3600  # seconds a new file is spared from sweeps while its item commits
 
-# Create upload directory if it doesn't exist
+# Create upload directories if they don't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['UPLOAD_TMP_FOLDER'], exist_ok=True)
 
 db.init_app(app)
+init_sqlite_tuning(app)
 with app.app_context():
     db.create_all()
+    upgrade_database()
+
+# Pay recurring allowances and interest in the background
+init_payouts(app)
+
+# Hash image uploads as Werkzeug writes them to disk, serve them with immutable
+# caching, and delete released or orphaned files in the background
+init_uploads(app)
+
+# Static files are served from memory; load them once the upload folder is known
+init_static_assets(app)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+    if app.static_folder is None:
+        return "Static folder not configured", 404
+
+    if app.debug:
+        static_assets.refresh_if_changed()
+    # Unknown paths are client-side routes of the single-page app
+    asset = static_assets.get(path) or static_assets.get('index.html')
+    if asset is None:
+        return "index.html not found", 404
+    return asset.respond(request)
 
 
 if __name__ == '__main__':
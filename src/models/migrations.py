@@ -0,0 +1,171 @@
+"""Startup upgrades for existing databases.
+
+``db.create_all()`` only creates missing tables, so anything added to a table
+that already exists in an older app.db is applied here. Data migrations are
+numbered by their position in ``MIGRATIONS`` and tracked in SQLite's
+``PRAGMA user_version``; each one must also be harmless on a freshly created,
+empty database.
+"""
+from sqlalchemy.schema import CreateTable
+from src.models.user import db, TeacherStats, Transaction, Purchase
+
+# (table, column) pairs that moved from Numeric(10, 2) to integer cents
+MONEY_COLUMNS = [
+    ('student', 'balance'),
+    ('item', 'price'),
+    ('"transaction"', 'amount'),
+    ('purchase', 'total_amount'),
+]
+
+
+def migrate_money_to_cents(conn):
+    """Rewrite decimal money values as integer cents"""
+    for table, column in MONEY_COLUMNS:
+        conn.exec_driver_sql(
+            f'UPDATE {table} SET {column} = CAST(ROUND({column} * 100) AS INTEGER) '
+            f'WHERE {column} IS NOT NULL'
+        )
+
+
+def backfill_balance_after(conn):
+    """Fill Transaction.balance_after where it is missing and return the row count.
+
+    One window-function pass: a row's balance is the student's current
+    balance minus everything applied after it.
+    """
+    result = conn.exec_driver_sql('''
+        UPDATE "transaction" SET balance_after = running.balance_after
+        FROM (
+            SELECT t.id,
+                   s.balance
+                   - SUM(CASE WHEN t.type = 'credit' THEN t.amount ELSE -t.amount END)
+                     OVER (PARTITION BY t.student_id)
+                   + SUM(CASE WHEN t.type = 'credit' THEN t.amount ELSE -t.amount END)
+                     OVER (PARTITION BY t.student_id ORDER BY t.created_at, t.id
+                           ROWS UNBOUNDED PRECEDING) AS balance_after
+            FROM "transaction" t JOIN student s ON s.id = t.student_id
+        ) AS running
+        WHERE "transaction".id = running.id AND "transaction".balance_after IS NULL
+    ''')
+    return result.rowcount
+
+
+def add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless create_all already made the column"""
+    columns = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+
+
+def add_transaction_balance_after(conn):
+    """Add Transaction.balance_after and backfill it"""
+    add_column(conn, '"transaction"', 'balance_after', 'INTEGER')
+    backfill_balance_after(conn)
+
+
+def add_data_versions(conn):
+    """Add the version counters behind ETag responses"""
+    add_column(conn, 'student', 'data_version', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'teacher_stats', 'data_version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def build_teacher_stats(conn):
+    """Fill teacher_stats for teachers created before it existed"""
+    TeacherStats.rebuild(conn)
+
+
+def rebuild_table(conn, table):
+    """Recreate ``table`` from its model, keeping its rows.
+
+    SQLite can't alter constraints in place, so this is its documented
+    procedure: create the new table, copy, drop the old one, rename. Indexes
+    go with the old table and are recreated by ensure_indexes.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    # Copy into a scratch MetaData that also holds the referenced tables
+    metadata = db.MetaData()
+    for other in db.metadata.tables.values():
+        other.to_metadata(metadata)
+    new_table = table.to_metadata(metadata, name=f'_new_{table.name}')
+    existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info({quote(table.name)})')}
+    columns = ', '.join(quote(column.name) for column in table.columns if column.name in existing)
+    conn.execute(CreateTable(new_table))
+    conn.exec_driver_sql(f'INSERT INTO {quote(new_table.name)} ({columns}) SELECT {columns} FROM {quote(table.name)}')
+    conn.exec_driver_sql(f'DROP TABLE {quote(table.name)}')
+    conn.exec_driver_sql(f'ALTER TABLE {quote(new_table.name)} RENAME TO {quote(table.name)}')
+
+
+def add_delete_cascades(conn):
+    """Rebuild tables whose foreign keys lack the models' ON DELETE actions"""
+    quote = conn.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        declared = {(fk.parent.name, (fk.ondelete or 'NO ACTION').upper()) for fk in table.foreign_keys}
+        actual = {(row[3], row[6].upper())
+                  for row in conn.exec_driver_sql(f'PRAGMA foreign_key_list({quote(table.name)})')}
+        if declared != actual:
+            rebuild_table(conn, table)
+
+
+def build_image_files(conn):
+    """Count references to images uploaded before ImageFile existed"""
+    conn.exec_driver_sql('''
+        INSERT INTO image_file (filename, ref_count)
+        SELECT substr(image_path, length('/uploads/') + 1), COUNT(*)
+        FROM item WHERE image_path LIKE '/uploads/%'
+        GROUP BY image_path
+        ON CONFLICT (filename) DO NOTHING
+    ''')
+
+
+def add_ledger_autoincrement(conn):
+    """Rebuild the ledger tables with AUTOINCREMENT so deleted ids are never handed out again"""
+    for table in (Transaction.__table__, Purchase.__table__):
+        ddl = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+        ).scalar()
+        if 'AUTOINCREMENT' not in ddl.upper():
+            rebuild_table(conn, table)
+
+
+MIGRATIONS = [
+    migrate_money_to_cents,
+    build_teacher_stats,
+    add_transaction_balance_after,
+    add_data_versions,
+    add_delete_cascades,
+    build_image_files,
+    add_ledger_autoincrement,
+]
+
+
+def run_migrations():
+    """Apply every migration newer than the database's user_version.
+
+    Foreign keys are off while they run, since dropping a rebuilt table
+    would otherwise cascade to its children. The pragma only changes outside
+    a transaction, and the connection is discarded afterwards.
+    """
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql('PRAGMA foreign_keys = OFF')
+        conn.commit()
+        try:
+            with conn.begin():
+                version = conn.exec_driver_sql('PRAGMA user_version').scalar()
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(conn)
+                    conn.exec_driver_sql(f'PRAGMA user_version = {number}')
+        finally:
+            conn.invalidate()
+
+
+def ensure_indexes():
+    """Create every index declared on the models that the database is missing"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def upgrade_database():
+    """Bring an existing database up to date with the current models"""
+    run_migrations()
+    ensure_indexes()
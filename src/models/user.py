@@ -1,26 +1,58 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 from flask_login import UserMixin
+from src.passwords import password_hasher
 
 db = SQLAlchemy()
 
+class Cents(db.TypeDecorator):
+    """Money stored as an integer number of cents"""
+    impl = db.Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else int(value)
+
+def to_cents(value):
+    """Convert a user-supplied amount such as '12.5' or 12.5 to integer cents"""
+    return int((Decimal(str(value)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def cents_to_float(cents):
+    """Convert integer cents to a float for JSON responses"""
+    return cents / 100
+
+def format_cents(cents):
+    """Format integer cents as a plain decimal string, e.g. 1205 -> '12.05'"""
+    sign = '-' if cents < 0 else ''
+    dollars, cents = divmod(abs(cents), 100)
+    return f'{sign}{dollars}.{cents:02d}'
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='teacher')  # teacher or student
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    students = db.relationship('Student', backref='teacher', lazy=True, cascade='all, delete-orphan')
-    items = db.relationship('Item', backref='teacher', lazy=True, cascade='all, delete-orphan')
+    # Child rows are removed by ON DELETE CASCADE in the database, not loaded and deleted one by one
+    students = db.relationship('Student', backref='teacher', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    items = db.relationship('Item', backref='teacher', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    stats = db.relationship('TeacherStats', uselist=False, lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    payouts = db.relationship('Payout', backref='teacher', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -37,23 +69,83 @@ class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(20), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
-    balance = db.Column(db.Numeric(10, 2), default=0.00)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    balance = db.Column(Cents, default=0)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    data_version = db.Column(db.Integer, nullable=False, default=0)  # bumped on every balance/ledger change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    transactions = db.relationship('Transaction', backref='student', lazy=True, cascade='all, delete-orphan')
-    purchases = db.relationship('Purchase', backref='student', lazy=True, cascade='all, delete-orphan')
+    transactions = db.relationship('Transaction', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    purchases = db.relationship('Purchase', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    cart_items = db.relationship('CartItem', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Student {self.name} ({self.student_id})>'
 
+    @classmethod
+    def expire_loaded(cls, student_ids):
+        """Expire the balance of any of these students already loaded in the session.
+
+        The balance UPDATEs call this instead of synchronize_session='fetch',
+        which adds the primary key to their RETURNING clause; under concurrent
+        requests that result was sometimes read back as the id.
+        """
+        mapper = db.inspect(cls)
+        for student_id in student_ids:
+            student = db.session.identity_map.get(mapper.identity_key_from_primary_key([student_id]))
+            if student is not None:
+                db.session.expire(student, ['balance', 'data_version'])
+
+    @classmethod
+    def adjust_balance(cls, student_id, delta):
+        """Atomically add ``delta`` cents to a student's balance.
+
+        Runs as one conditional UPDATE, so concurrent writers can't both pass
+        the funds check. Debits only apply when the balance covers them.
+        Returns the new balance, or None if nothing was updated.
+        """
+        stmt = db.update(cls).where(cls.id == student_id).values(
+            balance=cls.balance + delta, data_version=cls.data_version + 1
+        )
+        if delta < 0:
+            stmt = stmt.where(cls.balance >= -delta)
+        balance = db.session.execute(
+            stmt.returning(cls.balance),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+        if balance is not None:
+            cls.expire_loaded([student_id])
+        return balance
+
+    @classmethod
+    def adjust_balances(cls, teacher_id, delta, student_ids=None):
+        """Add ``delta`` cents to many of a teacher's students in one UPDATE.
+
+        ``student_ids`` of None means every student of the teacher. Debits
+        skip students whose balance doesn't cover them, with the same
+        guarantee as adjust_balance. Returns {student id: new balance} for
+        the rows that were updated.
+        """
+        stmt = db.update(cls).where(cls.teacher_id == teacher_id).values(
+            balance=cls.balance + delta, data_version=cls.data_version + 1
+        )
+        if student_ids is not None:
+            stmt = stmt.where(cls.id.in_(student_ids))
+        if delta < 0:
+            stmt = stmt.where(cls.balance >= -delta)
+        new_balances = dict(db.session.execute(
+            stmt.returning(cls.id, cls.balance),
+            execution_options={'synchronize_session': False}
+        ).all())
+        cls.expire_loaded(new_balances)
+        return new_balances
+
     def to_dict(self):
         return {
             'id': self.id,
             'student_id': self.student_id,
             'name': self.name,
-            'balance': float(self.balance),
+            'balance': cents_to_float(self.balance),
             'teacher_id': self.teacher_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -62,13 +154,14 @@ class Item(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Numeric(10, 2), nullable=False)
+    price = db.Column(Cents, nullable=False)
     image_path = db.Column(db.String(200))
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    purchases = db.relationship('Purchase', backref='item', lazy=True)
+    purchases = db.relationship('Purchase', backref='item', lazy=True, passive_deletes='all')  # purchased items can't be deleted
+    cart_items = db.relationship('CartItem', backref='item', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Item {self.name}>'
@@ -78,16 +171,34 @@ class Item(db.Model):
             'id': self.id,
             'name': self.name,
             'description': self.description,
-            'price': float(self.price),
+            'price': cents_to_float(self.price),
             'image_path': self.image_path
         }
 
+class ImageFile(db.Model):
+    """A stored upload, named by its SHA-256, and how many items use it"""
+    filename = db.Column(db.String(80), primary_key=True)  # <sha256>.<ext> in UPLOAD_FOLDER
+    size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImageFile {self.filename} x{self.ref_count}>'
+
 class Transaction(db.Model):
+    __table_args__ = (
+        # Per-student ledger, newest first
+        db.Index('ix_transaction_student_id_created_at', 'student_id', 'created_at'),
+        # Ids of deleted rows are never reused, so the ledger export can use them as a cursor
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
     type = db.Column(db.String(10), nullable=False)  # deposit or withdraw
-    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    amount = db.Column(Cents, nullable=False)
     description = db.Column(db.String(200))
+    balance_after = db.Column(Cents)  # student balance once this row was applied
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
@@ -98,17 +209,25 @@ class Transaction(db.Model):
             'id': self.id,
             'student_id': self.student_id,
             'type': self.type,
-            'amount': float(self.amount),
+            'amount': cents_to_float(self.amount),
             'description': self.description,
+            'balance_after': cents_to_float(self.balance_after) if self.balance_after is not None else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class Purchase(db.Model):
+    __table_args__ = (
+        # Per-student purchase history, newest first
+        db.Index('ix_purchase_student_id_created_at', 'student_id', 'created_at'),
+        # Ids of deleted rows are never reused, so the ledger export can use them as a cursor
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False, default=1)
-    total_amount = db.Column(db.Numeric(10, 2), nullable=False)
+    total_amount = db.Column(Cents, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
@@ -120,6 +239,185 @@ class Purchase(db.Model):
             'student_id': self.student_id,
             'item_id': self.item_id,
             'quantity': self.quantity,
-            'total_amount': float(self.total_amount),
+            'total_amount': cents_to_float(self.total_amount),
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class CartItem(db.Model):
+    """One line of a student's shopping cart, kept server-side"""
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<CartItem {self.quantity}x Item {self.item_id}>'
+
+    def to_dict(self):
+        return {
+            'item_id': self.item_id,
+            'quantity': self.quantity
+        }
+
+class TeacherStats(db.Model):
+    """Running dashboard totals for one teacher.
+
+    Every write that changes a total calls ``bump`` in the same transaction, so
+    reading the dashboard summary is a single primary-key lookup. ``rebuild``
+    recomputes all rows from the underlying tables.
+    """
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    student_count = db.Column(db.Integer, nullable=False, default=0)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    total_revenue = db.Column(Cents, nullable=False, default=0)
+    credits_issued = db.Column(Cents, nullable=False, default=0)
+    debits_issued = db.Column(Cents, nullable=False, default=0)
+    data_version = db.Column(db.Integer, nullable=False, default=0)  # bumped on every write to the teacher's data
+
+    def __repr__(self):
+        return f'<TeacherStats {self.teacher_id}>'
+
+    def to_dict(self):
+        return {
+            'student_count': self.student_count,
+            'item_count': self.item_count,
+            'total_revenue': cents_to_float(self.total_revenue),
+            'credits_issued': cents_to_float(self.credits_issued),
+            'debits_issued': cents_to_float(self.debits_issued)
+        }
+
+    @staticmethod
+    def _totals_select():
+        """SELECT of (teacher_id, *totals) for every teacher, computed from scratch"""
+        def ledger_sum(column, *criteria):
+            return db.select(db.func.coalesce(db.func.sum(column), 0)).join(
+                Student, Student.id == column.table.c.student_id
+            ).where(Student.teacher_id == User.id, *criteria).scalar_subquery()
+
+        return db.select(
+            User.id,
+            db.select(db.func.count(Student.id)).where(Student.teacher_id == User.id).scalar_subquery(),
+            db.select(db.func.count(Item.id)).where(Item.teacher_id == User.id).scalar_subquery(),
+            ledger_sum(Purchase.total_amount),
+            ledger_sum(Transaction.amount, Transaction.type == 'credit'),
+            ledger_sum(Transaction.amount, Transaction.type == 'debit')
+        )
+
+    @classmethod
+    def get_or_create(cls, teacher_id):
+        """Return the teacher's stats row, computing it if it does not exist yet"""
+        stats = db.session.get(cls, teacher_id)
+        if stats is None:
+            row = db.session.execute(cls._totals_select().where(User.id == teacher_id)).one()
+            stats = cls(teacher_id=row[0], student_count=row[1], item_count=row[2],
+                        total_revenue=row[3], credits_issued=row[4], debits_issued=row[5])
+            db.session.add(stats)
+        return stats
+
+    @classmethod
+    def bump(cls, teacher_id, **deltas):
+        """Add ``deltas`` to the teacher's totals and bump data_version in the current transaction.
+
+        Call this after the change it accounts for has been added to the
+        session: if the row is missing it is computed from scratch instead.
+        With no deltas it only marks the teacher's data as changed.
+        """
+        values = {name: getattr(cls, name) + delta for name, delta in deltas.items()}
+        values['data_version'] = cls.data_version + 1
+        result = db.session.execute(
+            db.update(cls).where(cls.teacher_id == teacher_id).values(**values),
+            execution_options={'synchronize_session': False}
+        )
+        if result.rowcount == 0:
+            cls.get_or_create(teacher_id)
+
+    @staticmethod
+    def student_totals(student_ids):
+        """Revenue, credits and debits attributable to the given students"""
+        total_revenue = db.session.query(
+            db.func.coalesce(db.func.sum(Purchase.total_amount), 0)
+        ).filter(Purchase.student_id.in_(student_ids)).scalar()
+        credits_issued, debits_issued = db.session.query(
+            db.func.coalesce(db.func.sum(db.case((Transaction.type == 'credit', Transaction.amount), else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((Transaction.type == 'debit', Transaction.amount), else_=0)), 0)
+        ).filter(Transaction.student_id.in_(student_ids)).one()
+        return {
+            'total_revenue': total_revenue,
+            'credits_issued': credits_issued,
+            'debits_issued': debits_issued
+        }
+
+    @classmethod
+    def rebuild(cls, connection=None):
+        """Recompute every teacher's row from scratch and return how many were written"""
+        connection = connection or db.session
+        connection.execute(db.delete(cls))
+        result = connection.execute(db.insert(cls).from_select(
+            ['teacher_id', 'student_count', 'item_count', 'total_revenue', 'credits_issued', 'debits_issued'],
+            cls._totals_select()
+        ))
+        return result.rowcount
+
+class Payout(db.Model):
+    """A recurring class payout: a fixed allowance or interest on each balance.
+
+    ``next_run_at`` is the start of the next period to pay. Each paid period
+    gets a PayoutRun row, unique per (payout, period), so a period is paid at
+    most once however many schedulers or cron jobs try.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # allowance or interest
+    amount = db.Column(Cents)  # allowance per student
+    rate_bp = db.Column(db.Integer)  # interest per period in basis points (100 = 1%)
+    description = db.Column(db.String(200))
+    interval_days = db.Column(db.Integer, nullable=False, default=7)
+    next_run_at = db.Column(db.DateTime, nullable=False, index=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    runs = db.relationship('PayoutRun', backref='payout', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f'<Payout {self.kind} every {self.interval_days}d>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'amount': cents_to_float(self.amount) if self.amount is not None else None,
+            'rate': self.rate_bp / 100 if self.rate_bp is not None else None,
+            'description': self.description,
+            'interval_days': self.interval_days,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'active': self.active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class PayoutRun(db.Model):
+    """One paid period of a Payout, with what it paid and how long it took"""
+    __table_args__ = (
+        db.UniqueConstraint('payout_id', 'period_start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    payout_id = db.Column(db.Integer, db.ForeignKey('payout.id', ondelete='CASCADE'), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    students_paid = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(Cents, nullable=False, default=0)
+    duration_ms = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PayoutRun {self.payout_id} {self.period_start}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'period_start': self.period_start.isoformat(),
+            'students_paid': self.students_paid,
+            'total_amount': cents_to_float(self.total_amount),
+            'duration_ms': self.duration_ms,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+class PasswordHasher:
+    """Runs password hashing and verification on a small bounded worker pool.
+
+    Werkzeug's scrypt/pbkdf2 hashing is CPU- and memory-heavy but runs inside
+    hashlib with the GIL released, so a thread pool gives real parallelism
+    while capping how many hashes (32 MB each for default scrypt) run at once.
+    Requests beyond the cap wait in the pool's queue; that wait is recorded
+    and logged every ``stats_interval`` seconds, and any single wait over
+    ``slow_queue_seconds`` is logged as a warning straight away.
+    """
+
+    def __init__(self):
+        self.method = 'scrypt'
+        self.current_method = None
+        self.timeout = None
+        self.slow_queue_seconds = 1.0
+        self.stats_interval = 300
+        self._executor = None
+        self._lock = threading.Lock()
+        self._count = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._window_started = time.monotonic()
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 30)
+        self.stats_interval = app.config.get('PASSWORD_HASH_STATS_INTERVAL', 300)
+        # Normalized "method:params" prefix that new hashes carry, e.g. scrypt:32768:8:1
+        self.current_method = generate_password_hash('', self.method).split('$', 1)[0]
+        workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        if workers:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if ``pwhash`` was made with other parameters than the configured ones"""
+        return self.current_method is not None and pwhash.split('$', 1)[0] != self.current_method
+
+    def _window_stats(self):
+        """Hash count and queue wait since the last logged summary; call with the lock held"""
+        return {
+            'count': self._count,
+            'queue_wait_avg_ms': self._queue_wait_total / self._count * 1000 if self._count else 0.0,
+            'queue_wait_max_ms': self._queue_wait_max * 1000
+        }
+
+    def _run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        submitted = time.perf_counter()
+        return self._executor.submit(self._timed, submitted, func, *args).result(timeout=self.timeout)
+
+    def _timed(self, submitted, func, *args):
+        waited = time.perf_counter() - submitted
+        summary = None
+        with self._lock:
+            self._count += 1
+            self._queue_wait_total += waited
+            self._queue_wait_max = max(self._queue_wait_max, waited)
+            if self.stats_interval and time.monotonic() - self._window_started >= self.stats_interval:
+                summary = self._window_stats()
+                self._count, self._queue_wait_total, self._queue_wait_max = 0, 0.0, 0.0
+                self._window_started = time.monotonic()
+        if waited > self.slow_queue_seconds:
+            logger.warning('Password hash waited %.0f ms for a worker', waited * 1000)
+        if summary is not None:
+            logger.info('Password hashing: %d hashes, queue wait avg %.1f ms, max %.1f ms',
+                        summary['count'], summary['queue_wait_avg_ms'], summary['queue_wait_max_ms'])
+        return func(*args)
+
+password_hasher = PasswordHasher()
+
+def init_password_hasher(app):
+    password_hasher.init_app(app)
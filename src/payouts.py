@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, Student, Transaction, TeacherStats, Payout, PayoutRun, cents_to_float
+from src.events import publish_balance
+
+logger = logging.getLogger(__name__)
+
+def credit_allowance(payout, created_at):
+    """Credit the allowance to every student of the teacher: one UPDATE and one batched INSERT"""
+    new_balances = Student.adjust_balances(payout.teacher_id, payout.amount)
+    if not new_balances:
+        return []
+    return db.session.scalars(
+        db.insert(Transaction).returning(Transaction),
+        [{'student_id': student_id, 'type': 'credit', 'amount': payout.amount,
+          'description': payout.description, 'balance_after': balance, 'created_at': created_at}
+         for student_id, balance in sorted(new_balances.items())]
+    ).all()
+
+def credit_interest(payout, created_at):
+    """Credit each student interest on their own balance: one INSERT ... SELECT and one UPDATE.
+
+    Both statements compute the interest from the same balances, since the
+    INSERT already holds the write lock when the UPDATE runs.
+    """
+    interest = Student.balance * payout.rate_bp // 10000
+    criteria = (Student.teacher_id == payout.teacher_id, interest > 0)
+    transactions = db.session.scalars(
+        db.insert(Transaction).from_select(
+            ['student_id', 'type', 'amount', 'description', 'balance_after', 'created_at'],
+            db.select(Student.id, db.literal('credit'), interest, db.literal(payout.description),
+                      Student.balance + interest, db.literal(created_at)).where(*criteria)
+        ).returning(Transaction)
+    ).all()
+    if transactions:
+        db.session.execute(
+            db.update(Student).where(*criteria).values(
+                balance=Student.balance + interest, data_version=Student.data_version + 1
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        Student.expire_loaded(transaction.student_id for transaction in transactions)
+    return transactions
+
+def run_payout(payout, now=None):
+    """Pay the period starting at ``payout.next_run_at`` and commit.
+
+    Returns the PayoutRun, or None if another worker already paid that
+    period. Periods missed while nothing was running are skipped, not paid
+    in a burst.
+    """
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    period_start = payout.next_run_at
+    run = PayoutRun(payout_id=payout.id, period_start=period_start)
+    db.session.add(run)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+
+    if payout.kind == 'interest':
+        transactions = credit_interest(payout, now)
+    else:
+        transactions = credit_allowance(payout, now)
+    total = sum(transaction.amount for transaction in transactions)
+    if transactions:
+        TeacherStats.bump(payout.teacher_id, credits_issued=total)
+        for transaction in transactions:
+            publish_balance(transaction.student_id, payout.teacher_id,
+                            cents_to_float(transaction.balance_after), transaction.to_dict())
+
+    interval = timedelta(days=payout.interval_days)
+    next_run_at = period_start + interval
+    while next_run_at <= now:
+        next_run_at += interval
+    payout.next_run_at = next_run_at
+    run.students_paid = len(transactions)
+    run.total_amount = total
+    run.duration_ms = round((time.perf_counter() - started) * 1000)
+    db.session.commit()
+    return run
+
+def run_due_payouts(now=None):
+    """Pay every active payout whose period has started and return the new runs"""
+    now = now or datetime.utcnow()
+    payout_ids = db.session.scalars(
+        db.select(Payout.id).where(Payout.active, Payout.next_run_at <= now).order_by(Payout.next_run_at)
+    ).all()
+    runs = []
+    for payout_id in payout_ids:
+        payout = db.session.get(Payout, payout_id)
+        if payout is None or not payout.active or payout.next_run_at > now:
+            continue
+        run = run_payout(payout, now)
+        if run is not None:
+            runs.append(run)
+    return runs
+
+class PayoutScheduler:
+    """Daemon thread that pays due payouts every ``interval`` seconds.
+
+    The first check happens one interval after start, so short-lived
+    processes such as ``flask`` CLI commands exit before it ever runs.
+    Running alongside cron or a second process is safe: each period is
+    claimed by a unique PayoutRun row.
+    """
+
+    def __init__(self):
+        self.interval = 60
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='payout-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, app):
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    for run in run_due_payouts():
+                        logger.info('Payout %s paid %d students in %d ms',
+                                    run.payout_id, run.students_paid, run.duration_ms)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Payout run failed')
+
+payout_scheduler = PayoutScheduler()
+
+def init_payouts(app):
+    """Start the in-process scheduler unless PAYOUT_POLL_INTERVAL is 0"""
+    payout_scheduler.interval = app.config.get('PAYOUT_POLL_INTERVAL', 60)
+    if payout_scheduler.interval:
+        payout_scheduler.start(app)
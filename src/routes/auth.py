@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
-from src.models.user import db, User, Student
-from src.auth import load_student
+from src.models.user import db, User, Student, TeacherStats
+from src.auth import load_student, invalidate_teacher
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -20,6 +20,7 @@ def register():
     # Create new teacher
     teacher = User(username=data['username'], role='teacher')
     teacher.set_password(data['password'])
+    teacher.stats = TeacherStats()
     
     db.session.add(teacher)
     db.session.commit()
@@ -44,6 +45,10 @@ def login():
         user = User.query.filter_by(username=data['username']).first()
         
         if user and user.check_password(data['password']):
+            # Upgrade hashes made with outdated parameters while we have the password
+            if user.password_needs_rehash():
+                user.set_password(data['password'])
+                db.session.commit()
             login_user(user)
             return jsonify({
                 'message': 'Login successful',
@@ -58,9 +63,9 @@ def login():
         student = load_student(data['student_id'])
         
         if student:
-            # Store student info in session for student authentication
+            # The session cookie only carries the student's id; everything
+            # else (including the cart) lives server-side
             session['student_id'] = student.id
-            session['student_data'] = student.to_dict()
             return jsonify({
                 'message': 'Login successful',
                 'student': student.to_dict(),
@@ -77,7 +82,9 @@ def logout():
     """Logout for both teachers and students"""
     logout_user()
     session.pop('student_id', None)
+    # Left over in cookies issued before the cart moved server-side
     session.pop('student_data', None)
+    session.pop('cart', None)
     return jsonify({'message': 'Logged out successfully'}), 200
 
 @auth_bp.route('/profile', methods=['GET'])
@@ -95,23 +102,27 @@ def update_profile():
     if not data:
         return jsonify({'error': 'Invalid request data'}), 400
     
+    # current_user is a cached identity record; edit the real row
+    user = db.session.get(User, current_user.id)
+    
     # Update username if provided
     if data.get('username'):
         # Check if username is already taken by another user
         existing_user = User.query.filter_by(username=data['username']).first()
-        if existing_user and existing_user.id != current_user.id:
+        if existing_user and existing_user.id != user.id:
             return jsonify({'error': 'Username already exists'}), 400
-        current_user.username = data['username']
+        user.username = data['username']
     
     # Update password if provided
     if data.get('password'):
-        current_user.set_password(data['password'])
+        user.set_password(data['password'])
     
     db.session.commit()
+    invalidate_teacher(user.id)
     
     return jsonify({
         'message': 'Profile updated successfully',
-        'user': current_user.to_dict()
+        'user': user.to_dict()
     }), 200
 
 @auth_bp.route('/check-auth', methods=['GET'])
@@ -124,11 +135,14 @@ def check_auth():
             'user_type': 'teacher'
         }), 200
     elif session.get('student_id'):
-        return jsonify({
-            'authenticated': True,
-            'student': session.get('student_data'),
-            'user_type': 'student'
-        }), 200
+        student = Student.query.get(session['student_id'])
+        if student:
+            return jsonify({
+                'authenticated': True,
+                'student': student.to_dict(),
+                'user_type': 'student'
+            }), 200
+        return jsonify({'authenticated': False}), 200
     else:
         return jsonify({'authenticated': False}), 200
 
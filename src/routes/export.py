@@ -0,0 +1,50 @@
+import hmac
+from datetime import datetime
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from src.ledger_export import FORMATS, export_cursor, export_ledger
+
+export_bp = Blueprint('export', __name__)
+
+def export_token_required(f):
+    """Require ``Authorization: Bearer <LEDGER_EXPORT_TOKEN>``; the export is off while no token is set"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config.get('LEDGER_EXPORT_TOKEN')
+        if not token:
+            return jsonify({'error': 'Ledger export is not enabled'}), 404
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+@export_bp.route('/ledger', methods=['GET'])
+@export_token_required
+def export_ledger_feed():
+    """Every teacher's transactions and purchases after a cursor, as gzipped CSV or JSON Lines.
+
+    Pass the previous response's X-Next-Transaction-Id and X-Next-Purchase-Id
+    back as ``transaction_after`` and ``purchase_after`` to get only newer rows.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': 'Format must be csv or jsonl'}), 400
+    try:
+        since = {
+            'transaction': int(request.args.get('transaction_after', 0)),
+            'purchase': int(request.args.get('purchase_after', 0))
+        }
+    except ValueError:
+        return jsonify({'error': 'Cursors must be integer ids'}), 400
+
+    # Fix the end of the export now, so the next cursor is known before streaming
+    until = export_cursor()
+
+    response = Response(stream_with_context(export_ledger(since, until, fmt)), mimetype='application/gzip')
+    response.headers.set('Content-Disposition', 'attachment',
+                         filename=f'ledger_{datetime.now():%Y%m%d%H%M%S}.{fmt}.gz')
+    response.headers['X-Next-Transaction-Id'] = str(max(until['transaction'], since['transaction']))
+    response.headers['X-Next-Purchase-Id'] = str(max(until['purchase'], since['purchase']))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -1,16 +1,69 @@
 from flask import Blueprint, request, jsonify, session
-from src.models.user import db, Student, Item, Transaction, Purchase
-from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.user import db, Student, Item, Transaction, Purchase, CartItem, TeacherStats, cents_to_float
+from src.auth import load_student_identity
+from src.etag import conditional
+from src.events import broker, class_channel, publish_balance, student_channel
+from datetime import datetime
 
 student_bp = Blueprint('student', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(row):
+    """Build the opaque cursor pointing just past a history row"""
+    return f'{row.created_at.isoformat()}_{row.id}'
+
+def decode_cursor(cursor):
+    """Split a cursor into (created_at, id); raises ValueError if malformed"""
+    created_at, row_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(created_at), int(row_id)
+
+def paginate(query, model):
+    """Apply keyset pagination on (created_at, id), newest first.
+
+    Returns (rows, next_cursor). Page N is an index seek on
+    (student_id, created_at) just like page 1.
+    """
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(db.tuple_(model.created_at, model.id) < decode_cursor(cursor))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1] if isinstance(rows[-1], model) else rows[-1][0]
+    return rows, encode_cursor(last)
+
 def get_current_student():
-    """Get current student from session"""
+    """Get the current student's identity (id, student_id, name, teacher_id) from session.
+
+    Served from the identity cache, so it costs no query on a hit. Views that
+    need the balance load the Student row themselves.
+    """
     student_id = session.get('student_id')
     if student_id:
-        return Student.query.get(student_id)
+        return load_student_identity(student_id)
     return None
 
+def load_cart(student):
+    """Return the student's cart as (CartItem, Item) pairs in one query.
+
+    Item is None for lines whose item no longer belongs to the student's teacher.
+    """
+    return db.session.query(CartItem, Item).outerjoin(
+        Item, db.and_(Item.id == CartItem.item_id, Item.teacher_id == student.teacher_id)
+    ).filter(CartItem.student_id == student.id).all()
+
+def read_quantity(data):
+    """The request's cart quantity if it is a positive whole number, else None"""
+    quantity = data.get('quantity', 1)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+        return None
+    return quantity
+
 def student_required(f):
     """Decorator to require student authentication"""
     def decorated_function(*args, **kwargs):
@@ -21,11 +74,29 @@ def student_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def dashboard_etag():
+    """ETag for the student dashboard: the student's and the teacher's versions in one query"""
+    student = get_current_student()
+    versions = db.session.query(Student.data_version, TeacherStats.data_version).join(
+        TeacherStats, TeacherStats.teacher_id == Student.teacher_id
+    ).filter(Student.id == student.id).first()
+    return None if versions is None else f'student-{student.id}-{versions[0]}-{versions[1]}'
+
+def store_etag():
+    """ETag for the store: the teacher's version"""
+    student = get_current_student()
+    version = db.session.query(TeacherStats.data_version).filter_by(teacher_id=student.teacher_id).scalar()
+    return None if version is None else f'store-{student.teacher_id}-{version}'
+
 @student_bp.route('/dashboard', methods=['GET'])
 @student_required
+@conditional(dashboard_etag)
 def dashboard():
     """Get student dashboard data"""
-    student = get_current_student()
+    student = db.session.get(Student, get_current_student().id)
+    if student is None:
+        # Deleted by another process while its identity was still cached
+        return jsonify({'error': 'Student authentication required'}), 401
     
     # Get recent transactions
     recent_transactions = Transaction.query.filter_by(student_id=student.id).order_by(
@@ -53,11 +124,12 @@ def dashboard():
 def get_balance():
     """Get current student balance"""
     student = get_current_student()
-    balance = Decimal(str(student.balance)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    return jsonify({'balance': float(balance)}), 200
+    balance = db.session.query(Student.balance).filter_by(id=student.id).scalar()
+    return jsonify({'balance': cents_to_float(balance)}), 200
 
 @student_bp.route('/store', methods=['GET'])
 @student_required
+@conditional(store_etag)
 def get_store_items():
     """Get all store items available for purchase"""
     student = get_current_student()
@@ -72,55 +144,50 @@ def get_store_items():
 @student_bp.route('/cart', methods=['POST'])
 @student_required
 def add_to_cart():
-    """Add item to shopping cart (stored in session)"""
+    """Add item to shopping cart"""
     data = request.get_json()
     if not data or not data.get('item_id'):
         return jsonify({'error': 'Item ID is required'}), 400
+    quantity = read_quantity(data)
+    if quantity is None:
+        return jsonify({'error': 'Quantity must be a positive whole number'}), 400
     student = get_current_student()
     item_id = data['item_id']
-    quantity = data.get('quantity', 1)
     item = Item.query.filter_by(id=item_id, teacher_id=student.teacher_id).first()
     if not item:
         return jsonify({'error': 'Item not found'}), 404
-    cart = session.get('cart', {})
-    price = Decimal(str(item.price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    if str(item_id) in cart:
-        cart[str(item_id)]['quantity'] += quantity
-    else:
-        cart[str(item_id)] = {
-            'item_id': int(item_id),
-            'quantity': quantity,
-            'price': float(price)
-        }
-    session['cart'] = cart
+    # Insert the line or add to its quantity in one statement
+    stmt = sqlite_insert(CartItem).values(student_id=student.id, item_id=item.id, quantity=quantity)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.student_id, CartItem.item_id],
+        set_={'quantity': CartItem.quantity + stmt.excluded.quantity}
+    ).returning(CartItem.quantity)
+    quantity = db.session.execute(stmt).scalar()
+    db.session.commit()
     return jsonify({
         'message': 'Item added to cart',
-        'cart': cart
+        'cart_item': {'item_id': item.id, 'quantity': quantity}
     }), 200
 
 @student_bp.route('/cart', methods=['GET'])
 @student_required
 def get_cart():
     """Get current shopping cart"""
-    cart = session.get('cart', {})
+    student = get_current_student()
     cart_items = []
-    total = Decimal('0.00')
-    for item_id, cart_item in cart.items():
-        item = Item.query.get(int(item_id))
+    total = 0
+    for cart_item, item in load_cart(student):
         if item:
-            price = Decimal(str(item.price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            item_total = Decimal(cart_item['quantity']) * price
-            item_total = item_total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            item_total = cart_item.quantity * item.price
             cart_items.append({
                 'item': item.to_dict(),
-                'quantity': cart_item['quantity'],
-                'item_total': float(item_total)
+                'quantity': cart_item.quantity,
+                'item_total': cents_to_float(item_total)
             })
             total += item_total
-    total = total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     return jsonify({
         'cart_items': cart_items,
-        'total': float(total)
+        'total': cents_to_float(total)
     }), 200
 
 @student_bp.route('/cart/<int:item_id>', methods=['PUT'])
@@ -132,120 +199,155 @@ def update_cart_item(item_id):
     if not data or 'quantity' not in data:
         return jsonify({'error': 'Quantity is required'}), 400
     
-    cart = session.get('cart', {})
     quantity = data['quantity']
+    if isinstance(quantity, bool) or not isinstance(quantity, int):
+        return jsonify({'error': 'Quantity must be a whole number'}), 400
+    student = get_current_student()
+    line = db.and_(CartItem.student_id == student.id, CartItem.item_id == item_id)
     
-    if str(item_id) in cart:
-        if quantity <= 0:
-            # Remove item from cart
-            del cart[str(item_id)]
-        else:
-            cart[str(item_id)]['quantity'] = quantity
-        
-        session['cart'] = cart
-        return jsonify({'message': 'Cart updated', 'cart': cart}), 200
+    if quantity <= 0:
+        # Remove item from cart
+        result = db.session.execute(db.delete(CartItem).where(line))
     else:
+        result = db.session.execute(db.update(CartItem).where(line).values(quantity=quantity))
+    
+    if result.rowcount == 0:
         return jsonify({'error': 'Item not in cart'}), 404
+    db.session.commit()
+    return jsonify({
+        'message': 'Cart updated',
+        'cart_item': {'item_id': item_id, 'quantity': max(quantity, 0)}
+    }), 200
 
 @student_bp.route('/cart/<int:item_id>', methods=['DELETE'])
 @student_required
 def remove_from_cart(item_id):
     """Remove item from cart"""
-    cart = session.get('cart', {})
+    student = get_current_student()
+    result = db.session.execute(db.delete(CartItem).where(
+        CartItem.student_id == student.id, CartItem.item_id == item_id
+    ))
     
-    if str(item_id) in cart:
-        del cart[str(item_id)]
-        session['cart'] = cart
-        return jsonify({'message': 'Item removed from cart'}), 200
-    else:
+    if result.rowcount == 0:
         return jsonify({'error': 'Item not in cart'}), 404
+    db.session.commit()
+    return jsonify({'message': 'Item removed from cart'}), 200
 
 @student_bp.route('/purchase', methods=['POST'])
 @student_required
 def purchase_items():
     """Complete purchase of items in cart"""
     student = get_current_student()
-    cart = session.get('cart', {})
+    cart = load_cart(student)
     if not cart:
         return jsonify({'error': 'Cart is empty'}), 400
-    total_amount = Decimal('0.00')
+    total_amount = 0
     purchase_items = []
-    for item_id, cart_item in cart.items():
-        item = Item.query.filter_by(id=int(item_id), teacher_id=student.teacher_id).first()
+    for cart_item, item in cart:
         if not item:
-            return jsonify({'error': f'Item {item_id} not found'}), 404
-        price = Decimal(str(item.price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        item_total = Decimal(cart_item['quantity']) * price
-        item_total = item_total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            return jsonify({'error': f'Item {cart_item.item_id} not found'}), 404
+        item_total = cart_item.quantity * item.price
         total_amount += item_total
         purchase_items.append({
             'item': item,
-            'quantity': cart_item['quantity'],
+            'quantity': cart_item.quantity,
             'total': item_total
         })
-    total_amount = total_amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    student_balance = Decimal(str(student.balance)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    if student_balance < total_amount:
-        return jsonify({
-            'error': 'Insufficient balance',
-            'required': float(total_amount),
-            'available': float(student_balance)
-        }), 400
     try:
-        student.balance = float(student_balance - total_amount)
+        new_balance = Student.adjust_balance(student.id, -total_amount)
+        if new_balance is None:
+            db.session.rollback()
+            return jsonify({
+                'error': 'Insufficient balance',
+                'required': cents_to_float(total_amount),
+                'available': cents_to_float(
+                    db.session.query(Student.balance).filter_by(id=student.id).scalar()
+                )
+            }), 400
         purchases = []
         for purchase_item in purchase_items:
             purchase = Purchase(
                 student_id=student.id,
                 item_id=purchase_item['item'].id,
                 quantity=purchase_item['quantity'],
-                total_amount=float(purchase_item['total'])
+                total_amount=purchase_item['total']
             )
             db.session.add(purchase)
             purchases.append(purchase)
         transaction = Transaction(
             student_id=student.id,
             type='debit',
-            amount=float(total_amount),
-            description=f'Purchase of {len(purchase_items)} items'
+            amount=total_amount,
+            description=f'Purchase of {len(purchase_items)} items',
+            balance_after=new_balance
         )
         db.session.add(transaction)
-        db.session.commit()
-        session['cart'] = {}
-        return jsonify({
+        # Take off only what was priced and paid for: lines another tab added or
+        # topped up since load_cart keep the rest of their quantity
+        bought = {purchase_item['item'].id: purchase_item['quantity'] for purchase_item in purchase_items}
+        bought_lines = db.and_(CartItem.student_id == student.id, CartItem.item_id.in_(bought))
+        db.session.execute(
+            db.update(CartItem).where(bought_lines)
+            .values(quantity=CartItem.quantity - db.case(bought, value=CartItem.item_id)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(
+            db.delete(CartItem).where(bought_lines, CartItem.quantity <= 0),
+            execution_options={'synchronize_session': False}
+        )
+        TeacherStats.bump(student.teacher_id, total_revenue=total_amount, debits_issued=total_amount)
+        db.session.flush()
+        # Serialize before commit so the response doesn't reload every expired row
+        response_data = {
             'message': 'Purchase completed successfully',
-            'total_amount': float(total_amount),
-            'new_balance': float(student.balance),
+            'total_amount': cents_to_float(total_amount),
+            'new_balance': cents_to_float(new_balance),
             'purchases': [purchase.to_dict() for purchase in purchases],
             'transaction': transaction.to_dict()
-        }), 200
+        }
+        publish_balance(student.id, student.teacher_id, response_data['new_balance'], response_data['transaction'])
+        db.session.commit()
+        return jsonify(response_data), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Purchase failed. Please try again.'}), 500
 
+@student_bp.route('/events', methods=['GET'])
+@student_required
+def events():
+    """Server-Sent Events: this student's balance changes and store changes, as they commit"""
+    student = get_current_student()
+    return broker.stream([student_channel(student.id), class_channel(student.teacher_id)])
+
 @student_bp.route('/transactions', methods=['GET'])
 @student_required
 def get_transactions():
-    """Get student transaction history"""
+    """Get one page of student transaction history"""
     student = get_current_student()
     
-    transactions = Transaction.query.filter_by(student_id=student.id).order_by(
-        Transaction.created_at.desc()
-    ).all()
+    try:
+        transactions, next_cursor = paginate(Transaction.query.filter_by(student_id=student.id), Transaction)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     return jsonify({
-        'transactions': [transaction.to_dict() for transaction in transactions]
+        'transactions': [transaction.to_dict() for transaction in transactions],
+        'next_cursor': next_cursor
     }), 200
 
 @student_bp.route('/purchases', methods=['GET'])
 @student_required
 def get_purchases():
-    """Get student purchase history"""
+    """Get one page of student purchase history"""
     student = get_current_student()
     
-    purchases = db.session.query(Purchase, Item).join(Item).filter(
-        Purchase.student_id == student.id
-    ).order_by(Purchase.created_at.desc()).all()
+    try:
+        purchases, next_cursor = paginate(
+            db.session.query(Purchase, Item).join(Item).filter(Purchase.student_id == student.id),
+            Purchase
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     return jsonify({
         'purchases': [
@@ -253,6 +355,7 @@ def get_purchases():
                 'purchase': purchase.to_dict(),
                 'item': item.to_dict()
             } for purchase, item in purchases
-        ]
+        ],
+        'next_cursor': next_cursor
     }), 200
 
@@ -1,37 +1,165 @@
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from src.models.user import db, Student, Item, Transaction, Purchase
-from decimal import Decimal, ROUND_HALF_UP
-import os
-import uuid
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, Student, Item, Transaction, Purchase, TeacherStats, Payout, PayoutRun, to_cents, cents_to_float, format_cents
+from src.auth import invalidate_student
+from src.etag import conditional
+from src.events import broker, class_channel, publish_balance, publish_item, teacher_channel
+from src.uploads import is_image_filename, release_images, store_image
+from src.streaming import CHUNK_SIZE, ChunkBuffer, EchoWriter
 from datetime import datetime
+from urllib.parse import quote
 import csv
+import heapq
 import io
+import unicodedata
+import zipfile
 
 teacher_bp = Blueprint('teacher', __name__)
 
-def allowed_file(filename):
-    """Check if file extension is allowed for image uploads"""
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+IMPORT_BATCH_SIZE = 1000  # rows per executemany INSERT
+IMPORT_LOOKUP_SIZE = 10000  # student_ids per duplicate-check query, well under SQLite's variable limit
+STATEMENT_BATCH_SIZE = 500  # ledger rows fetched at a time for statements
+
+def set_attachment(response, filename):
+    """Mark a response as a download named ``filename`` (non-ASCII names included)"""
+    try:
+        filename.encode('ascii')
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        response.headers.set('Content-Disposition', 'attachment', filename=simple,
+                             **{'filename*': f"UTF-8''{quote(filename, safe='')}"})
+
+def statement_header(name, student_number, balance):
+    """Rows at the top of a student's CSV statement"""
+    return [
+        ['PSTEP Classroom Bank Statement'],
+        ['Student Name:', name],
+        ['Student ID:', student_number],
+        ['Current Balance:', f'${format_cents(balance)}'],
+        ['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
+        [],  # Empty row
+        ['Date', 'Type', 'Amount', 'Description', 'Balance After']
+    ]
+
+def ledger_selects(student_ids):
+    """Statement columns of the students' transactions and purchases, ordered by student, newest first"""
+    transactions = (
+        db.select(Transaction.student_id, Transaction.created_at, Transaction.type, Transaction.amount,
+                  Transaction.description, Transaction.balance_after)
+        .where(Transaction.student_id.in_(student_ids))
+        .order_by(Transaction.student_id, Transaction.created_at.desc(), Transaction.id.desc())
+    )
+    purchases = (
+        db.select(Purchase.student_id, Purchase.created_at, Purchase.total_amount, Purchase.quantity, Item.name)
+        .join(Item)
+        .where(Purchase.student_id.in_(student_ids))
+        .order_by(Purchase.student_id, Purchase.created_at.desc(), Purchase.id.desc())
+    )
+    return transactions, purchases
+
+def merge_ledger(transactions, purchases):
+    """Merge one student's transaction and purchase rows (each newest first) into statement rows"""
+    transaction_records = (
+        (created_at, type_.title(), f'${format_cents(amount)}', description,
+         f'${format_cents(balance_after)}' if balance_after is not None else '')
+        for _, created_at, type_, amount, description, balance_after in transactions
+    )
+    purchase_records = (
+        (created_at, 'Purchase', f'-${format_cents(total_amount)}', f'Purchased {quantity}x {name}', '')
+        for _, created_at, total_amount, quantity, name in purchases
+    )
+    for created_at, *rest in heapq.merge(transaction_records, purchase_records,
+                                         key=lambda record: record[0], reverse=True):
+        yield [created_at.strftime('%Y-%m-%d %H:%M:%S'), *rest]
+
+def statement_records(student_id, batch_size=STATEMENT_BATCH_SIZE):
+    """Yield a student's statement rows, newest first, without loading the history.
+
+    Transactions and purchases are each read in index order with yield_per
+    and merged as they stream, so memory use does not grow with history length.
+    """
+    transactions, purchases = ledger_selects([student_id])
+    yield from merge_ledger(
+        db.session.execute(transactions.execution_options(yield_per=batch_size)),
+        db.session.execute(purchases.execution_options(yield_per=batch_size))
+    )
+
+class LedgerCursor:
+    """Walks rows ordered by student id, handing out one student's rows at a time"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._row = next(self._rows, None)
+
+    def rows_for(self, student_id):
+        """Rows for ``student_id``; call with increasing ids and exhaust each before the next"""
+        while self._row is not None and self._row[0] < student_id:
+            self._row = next(self._rows, None)  # student added after the roster was read
+        while self._row is not None and self._row[0] == student_id:
+            yield self._row
+            self._row = next(self._rows, None)
+
+def read_roster(upload):
+    """Validate a roster CSV (name, student_id[, balance]) as it is read.
+
+    Returns (rows, errors): rows are Student column dicts tagged with their
+    line number, errors are per-line messages. Duplicates within the file are
+    caught here; duplicates against the database are checked by the caller.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''))
+    fields = {(field or '').strip().lower() for field in reader.fieldnames or ()}
+    if not {'name', 'student_id'} <= fields:
+        raise ValueError('CSV header must include name and student_id columns')
+    rows, errors, seen = [], [], set()
+    for record in reader:
+        record = {(key or '').strip().lower(): (value or '').strip()
+                  for key, value in record.items() if isinstance(value, str)}
+        line = reader.line_num
+        name, student_id = record.get('name', ''), record.get('student_id', '')
+        if not name or not student_id:
+            errors.append({'line': line, 'student_id': student_id, 'error': 'Name and student ID are required'})
+            continue
+        if len(name) > 100 or len(student_id) > 20:
+            errors.append({'line': line, 'student_id': student_id, 'error': 'Name or student ID is too long'})
+            continue
+        try:
+            balance = to_cents(record.get('balance') or 0)
+        except (ArithmeticError, ValueError):
+            errors.append({'line': line, 'student_id': student_id, 'error': 'Invalid balance'})
+            continue
+        if balance < 0:
+            errors.append({'line': line, 'student_id': student_id, 'error': 'Balance cannot be negative'})
+            continue
+        if student_id in seen:
+            errors.append({'line': line, 'student_id': student_id, 'error': 'Student ID repeated in file'})
+            continue
+        seen.add(student_id)
+        rows.append({'line': line, 'name': name, 'student_id': student_id, 'balance': balance})
+    return rows, errors
+
+def read_id_list(data, key):
+    """The non-empty list of integer ids under ``data[key]`` as a set, or None if it isn't one"""
+    ids = data.get(key) if data else None
+    if not isinstance(ids, list) or not ids or not all(isinstance(id_, int) for id_ in ids):
+        return None
+    return set(ids)
+
+def teacher_etag():
+    """ETag for views over the current teacher's data: one version lookup"""
+    version = db.session.query(TeacherStats.data_version).filter_by(teacher_id=current_user.id).scalar()
+    return None if version is None else f'teacher-{current_user.id}-{version}'
 
 @teacher_bp.route('/dashboard', methods=['GET'])
 @login_required
+@conditional(teacher_etag)
 def dashboard():
     """Get teacher dashboard data"""
     students = Student.query.filter_by(teacher_id=current_user.id).all()
     items = Item.query.filter_by(teacher_id=current_user.id).all()
-    
-    # Calculate total revenue from all purchases by students of this teacher
-    student_ids = [student.id for student in students]
-    if student_ids:
-        total_revenue = db.session.query(
-            db.func.coalesce(db.func.sum(Purchase.total_amount), 0)
-        ).filter(Purchase.student_id.in_(student_ids)).scalar()
-        total_revenue = Decimal(str(total_revenue)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    else:
-        total_revenue = Decimal('0.00')
+    stats = TeacherStats.get_or_create(current_user.id)
     
     # Get recent transactions
     recent_transactions = db.session.query(Transaction).join(Student).filter(
@@ -41,10 +169,41 @@ def dashboard():
     return jsonify({
         'students': [student.to_dict() for student in students],
         'items': [item.to_dict() for item in items],
-        'total_revenue': float(total_revenue),
+        'total_revenue': cents_to_float(stats.total_revenue),
+        'stats': stats.to_dict(),
         'recent_transactions': [transaction.to_dict() for transaction in recent_transactions]
     }), 200
 
+@teacher_bp.route('/summary', methods=['GET'])
+@login_required
+@conditional(teacher_etag)
+def summary():
+    """Get dashboard totals (one primary-key lookup, no student or item rows)"""
+    stats = TeacherStats.get_or_create(current_user.id)
+    return jsonify(stats.to_dict()), 200
+
+@teacher_bp.route('/students', methods=['GET'])
+@login_required
+@conditional(teacher_etag)
+def get_students():
+    """Get all students of the current teacher"""
+    students = Student.query.filter_by(teacher_id=current_user.id).all()
+    return jsonify({'students': [student.to_dict() for student in students]}), 200
+
+@teacher_bp.route('/items', methods=['GET'])
+@login_required
+@conditional(teacher_etag)
+def get_items():
+    """Get all store items of the current teacher"""
+    items = Item.query.filter_by(teacher_id=current_user.id).all()
+    return jsonify({'items': [item.to_dict() for item in items]}), 200
+
+@teacher_bp.route('/events', methods=['GET'])
+@login_required
+def events():
+    """Server-Sent Events: student balance changes and catalog changes, as they commit"""
+    return broker.stream([teacher_channel(current_user.id), class_channel(current_user.id)])
+
 @teacher_bp.route('/students', methods=['POST'])
 @login_required
 def add_student():
@@ -58,15 +217,15 @@ def add_student():
     if Student.query.filter_by(student_id=data['student_id']).first():
         return jsonify({'error': 'Student ID already exists'}), 400
     
-    balance = Decimal(str(data.get('balance', 0.00))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     student = Student(
         name=data['name'],
         student_id=data['student_id'],
-        balance=float(balance),
+        balance=to_cents(data.get('balance', 0)),
         teacher_id=current_user.id
     )
     
     db.session.add(student)
+    TeacherStats.bump(current_user.id, student_count=1)
     db.session.commit()
     
     return jsonify({
@@ -74,6 +233,53 @@ def add_student():
         'student': student.to_dict()
     }), 201
 
+@teacher_bp.route('/students/import', methods=['POST'])
+@login_required
+def import_students():
+    """Add students in bulk from an uploaded CSV with name, student_id and optional balance columns"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'CSV file is required'}), 400
+    
+    try:
+        rows, errors = read_roster(upload.stream)
+    except (ValueError, csv.Error) as e:
+        return jsonify({'error': f'Invalid CSV: {e}'}), 400
+    
+    # Reject IDs that already exist, a few large IN queries instead of one per row
+    student_ids = [row['student_id'] for row in rows]
+    existing = set()
+    for start in range(0, len(student_ids), IMPORT_LOOKUP_SIZE):
+        existing.update(db.session.scalars(
+            db.select(Student.student_id).where(Student.student_id.in_(student_ids[start:start + IMPORT_LOOKUP_SIZE]))
+        ))
+    new_rows = []
+    for row in rows:
+        line = row.pop('line')
+        if row['student_id'] in existing:
+            errors.append({'line': line, 'student_id': row['student_id'], 'error': 'Student ID already exists'})
+        else:
+            row['teacher_id'] = current_user.id
+            new_rows.append(row)
+    
+    try:
+        for start in range(0, len(new_rows), IMPORT_BATCH_SIZE):
+            db.session.execute(db.insert(Student), new_rows[start:start + IMPORT_BATCH_SIZE])
+        if new_rows:
+            TeacherStats.bump(current_user.id, student_count=len(new_rows))
+        db.session.commit()
+    except IntegrityError:
+        # Another request added one of these IDs since the duplicate check
+        db.session.rollback()
+        return jsonify({'error': 'Student IDs changed during import. Please try again.'}), 409
+    
+    errors.sort(key=lambda error: error['line'])
+    return jsonify({
+        'message': f'Imported {len(new_rows)} students',
+        'imported': len(new_rows),
+        'errors': errors
+    }), 201 if new_rows else 200
+
 @teacher_bp.route('/students/<int:student_id>', methods=['DELETE'])
 @login_required
 def delete_student(student_id):
@@ -83,11 +289,44 @@ def delete_student(student_id):
     if not student:
         return jsonify({'error': 'Student not found'}), 404
     
+    totals = TeacherStats.student_totals([student.id])
     db.session.delete(student)
+    db.session.flush()
+    TeacherStats.bump(current_user.id, student_count=-1, **{name: -value for name, value in totals.items()})
     db.session.commit()
+    invalidate_student(student_id)
     
     return jsonify({'message': 'Student deleted successfully'}), 200
 
+@teacher_bp.route('/students/delete', methods=['POST'])
+@login_required
+def delete_students():
+    """Delete several students; their ledgers and carts go with them by ON DELETE CASCADE"""
+    student_ids = read_id_list(request.get_json(), 'student_ids')
+    
+    if student_ids is None:
+        return jsonify({'error': 'Provide a list of student_ids'}), 400
+    
+    owned = db.session.scalars(
+        db.select(Student.id).where(Student.teacher_id == current_user.id, Student.id.in_(student_ids))
+    ).all()
+    if owned:
+        totals = TeacherStats.student_totals(owned)
+        deleted = db.session.execute(
+            db.delete(Student).where(Student.teacher_id == current_user.id, Student.id.in_(owned)),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        TeacherStats.bump(current_user.id, student_count=-deleted, **{name: -value for name, value in totals.items()})
+        db.session.commit()
+        for student_id in owned:
+            invalidate_student(student_id)
+    
+    return jsonify({
+        'message': f'Deleted {len(owned)} students',
+        'deleted': sorted(owned),
+        'not_found': sorted(student_ids - set(owned))
+    }), 200
+
 @teacher_bp.route('/students/<int:student_id>/balance', methods=['POST'])
 @login_required
 def update_student_balance(student_id):
@@ -96,34 +335,45 @@ def update_student_balance(student_id):
     if not data or 'type' not in data or 'amount' not in data:
         return jsonify({'error': 'Invalid data provided'}), 400
     
+    transaction_type = data['type']
+    if transaction_type not in ('credit', 'debit'):
+        return jsonify({'error': 'Invalid transaction type'}), 400
+    
+    try:
+        amount = to_cents(data['amount'])
+    except (ArithmeticError, ValueError):
+        return jsonify({'error': 'Invalid amount'}), 400
+    if amount <= 0:
+        return jsonify({'error': 'Amount must be positive'}), 400
+    
     student = Student.query.filter_by(id=student_id, teacher_id=current_user.id).first()
     
     if not student:
         return jsonify({'error': 'Student not found'}), 404
     
-    amount = Decimal(str(data['amount'])).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    transaction_type = data['type']
     description = data.get('description', f'Manual {transaction_type} by teacher')
     
     # Update student balance
-    if transaction_type == 'credit':
-        student.balance += amount
-    elif transaction_type == 'debit':
-        if student.balance < amount:
+    new_balance = Student.adjust_balance(student.id, amount if transaction_type == 'credit' else -amount)
+    if new_balance is None:
+        db.session.rollback()
+        if transaction_type == 'debit':
             return jsonify({'error': 'Insufficient balance'}), 400
-        student.balance -= amount
-    else:
-        return jsonify({'error': 'Invalid transaction type'}), 400
+        return jsonify({'error': 'Student not found'}), 404  # deleted since it was loaded
     
     # Create transaction record
     transaction = Transaction(
         student_id=student.id,
         type=transaction_type,
-        amount=float(amount),
-        description=description
+        amount=amount,
+        description=description,
+        balance_after=new_balance
     )
     
     db.session.add(transaction)
+    TeacherStats.bump(current_user.id, **{f'{transaction_type}s_issued': amount})
+    db.session.flush()
+    publish_balance(student.id, current_user.id, cents_to_float(new_balance), transaction.to_dict())
     db.session.commit()
     
     return jsonify({
@@ -132,6 +382,192 @@ def update_student_balance(student_id):
         'transaction': transaction.to_dict()
     }), 200
 
+@teacher_bp.route('/students/balance', methods=['POST'])
+@login_required
+def update_balances():
+    """Credit or debit many students at once: ``student_ids`` or ``all`` plus type and amount"""
+    data = request.get_json()
+    
+    if not data or 'type' not in data or 'amount' not in data:
+        return jsonify({'error': 'Invalid data provided'}), 400
+    
+    transaction_type = data['type']
+    if transaction_type not in ('credit', 'debit'):
+        return jsonify({'error': 'Invalid transaction type'}), 400
+    
+    try:
+        amount = to_cents(data['amount'])
+    except (ArithmeticError, ValueError):
+        return jsonify({'error': 'Invalid amount'}), 400
+    if amount <= 0:
+        return jsonify({'error': 'Amount must be positive'}), 400
+    
+    if data.get('all'):
+        student_ids = None
+    else:
+        student_ids = read_id_list(data, 'student_ids')
+        if student_ids is None:
+            return jsonify({'error': 'Provide a list of student_ids or set all'}), 400
+    description = data.get('description', f'Class {transaction_type} by teacher')
+    
+    new_balances = Student.adjust_balances(
+        current_user.id, amount if transaction_type == 'credit' else -amount, student_ids
+    )
+    
+    # Whoever was asked for but not updated either lacks funds or isn't this teacher's
+    failed = []
+    if student_ids is None and transaction_type == 'credit' or \
+            student_ids is not None and student_ids <= new_balances.keys():
+        available = {}
+    else:
+        query = db.session.query(Student.id, Student.name, Student.balance).filter(
+            Student.teacher_id == current_user.id, Student.id.not_in(new_balances.keys())
+        )
+        if student_ids is not None:
+            query = query.filter(Student.id.in_(student_ids))
+        available = {student_id: (name, balance) for student_id, name, balance in query}
+    missing = student_ids - new_balances.keys() if student_ids is not None else available.keys()
+    for student_id in sorted(missing):
+        if student_id in available:
+            name, balance = available[student_id]
+            failed.append({'student_id': student_id, 'name': name, 'error': 'Insufficient balance',
+                           'available': cents_to_float(balance)})
+        else:
+            failed.append({'student_id': student_id, 'error': 'Student not found'})
+    
+    transactions = []
+    if new_balances:
+        transactions = db.session.scalars(
+            db.insert(Transaction).returning(Transaction),
+            [{'student_id': student_id, 'type': transaction_type, 'amount': amount,
+              'description': description, 'balance_after': balance}
+             for student_id, balance in sorted(new_balances.items())]
+        ).all()
+        TeacherStats.bump(current_user.id, **{f'{transaction_type}s_issued': amount * len(new_balances)})
+        for transaction in transactions:
+            publish_balance(transaction.student_id, current_user.id,
+                            cents_to_float(transaction.balance_after), transaction.to_dict())
+    db.session.commit()
+    
+    return jsonify({
+        'message': f'Updated {len(new_balances)} students',
+        'updated': [{'student_id': student_id, 'balance': cents_to_float(balance)}
+                    for student_id, balance in sorted(new_balances.items())],
+        'failed': failed
+    }), 200
+
+def read_payout_fields(data, payout):
+    """Apply the editable payout fields in ``data``; returns an error message or None"""
+    try:
+        if 'amount' in data:
+            payout.amount = to_cents(data['amount'])
+        if 'rate' in data:
+            payout.rate_bp = to_cents(data['rate'])  # percent to basis points scales like dollars to cents
+        if 'interval_days' in data:
+            payout.interval_days = int(data['interval_days'])
+        if 'next_run_at' in data:
+            payout.next_run_at = datetime.fromisoformat(data['next_run_at'])
+    except (ArithmeticError, TypeError, ValueError):
+        return 'Invalid amount, rate, interval or start date'
+    if 'description' in data:
+        payout.description = data['description']
+    if 'active' in data:
+        payout.active = bool(data['active'])
+    if payout.kind == 'allowance' and not (payout.amount or 0) > 0:
+        return 'Allowance amount must be positive'
+    if payout.kind == 'interest' and not (payout.rate_bp or 0) > 0:
+        return 'Interest rate must be positive'
+    if payout.interval_days < 1:
+        return 'Interval must be at least one day'
+    return None
+
+@teacher_bp.route('/payouts', methods=['GET'])
+@login_required
+def get_payouts():
+    """Get the teacher's recurring payouts"""
+    payouts = Payout.query.filter_by(teacher_id=current_user.id).order_by(Payout.id).all()
+    return jsonify({'payouts': [payout.to_dict() for payout in payouts]}), 200
+
+@teacher_bp.route('/payouts', methods=['POST'])
+@login_required
+def add_payout():
+    """Schedule a recurring allowance (amount) or interest payment (rate in percent)"""
+    data = request.get_json()
+    
+    if not data or data.get('kind') not in ('allowance', 'interest'):
+        return jsonify({'error': 'Kind must be allowance or interest'}), 400
+    
+    payout = Payout(
+        teacher_id=current_user.id,
+        kind=data['kind'],
+        description=data['kind'].title(),
+        interval_days=7,
+        next_run_at=datetime.utcnow(),
+        active=True
+    )
+    error = read_payout_fields(data, payout)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    db.session.add(payout)
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Payout scheduled successfully',
+        'payout': payout.to_dict()
+    }), 201
+
+@teacher_bp.route('/payouts/<int:payout_id>', methods=['PUT'])
+@login_required
+def update_payout(payout_id):
+    """Change, pause or resume a recurring payout"""
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    payout = Payout.query.filter_by(id=payout_id, teacher_id=current_user.id).first()
+    
+    if not payout:
+        return jsonify({'error': 'Payout not found'}), 404
+    
+    error = read_payout_fields(data, payout)
+    if error:
+        db.session.rollback()
+        return jsonify({'error': error}), 400
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Payout updated successfully',
+        'payout': payout.to_dict()
+    }), 200
+
+@teacher_bp.route('/payouts/<int:payout_id>', methods=['DELETE'])
+@login_required
+def delete_payout(payout_id):
+    """Delete a recurring payout and its run history"""
+    payout = Payout.query.filter_by(id=payout_id, teacher_id=current_user.id).first()
+    
+    if not payout:
+        return jsonify({'error': 'Payout not found'}), 404
+    
+    db.session.delete(payout)
+    db.session.commit()
+    
+    return jsonify({'message': 'Payout deleted successfully'}), 200
+
+@teacher_bp.route('/payouts/<int:payout_id>/runs', methods=['GET'])
+@login_required
+def get_payout_runs(payout_id):
+    """Get the most recent paid periods of a payout, with their timings"""
+    payout = Payout.query.filter_by(id=payout_id, teacher_id=current_user.id).first()
+    
+    if not payout:
+        return jsonify({'error': 'Payout not found'}), 404
+    
+    runs = PayoutRun.query.filter_by(payout_id=payout.id).order_by(PayoutRun.period_start.desc()).limit(20).all()
+    return jsonify({'runs': [run.to_dict() for run in runs]}), 200
+
 @teacher_bp.route('/items', methods=['POST'])
 @login_required
 def add_item():
@@ -145,7 +581,7 @@ def add_item():
         return jsonify({'error': 'Name and price are required'}), 400
     
     try:
-        price = Decimal(str(price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        price = to_cents(price)
     except Exception:
         return jsonify({'error': 'Invalid price format'}), 400
     
@@ -154,22 +590,26 @@ def add_item():
     # Handle file upload
     if 'image' in request.files:
         file = request.files['image']
-        if file and file.filename and allowed_file(file.filename):
-            # Generate unique filename
-            filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            image_path = f'/uploads/{filename}'
+        if file and file.filename and is_image_filename(file.filename):
+            # Stored under its content hash; identical images share one file
+            try:
+                image_path = store_image(file)
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 400
     
     item = Item(
         name=name,
         description=description,
-        price=float(price),
+        price=price,
         image_path=image_path,
         teacher_id=current_user.id
     )
     
     db.session.add(item)
+    TeacherStats.bump(current_user.id, item_count=1)
+    db.session.flush()
+    publish_item(current_user.id, 'added', item.to_dict())
     db.session.commit()
     
     return jsonify({
@@ -197,27 +637,27 @@ def update_item(item_id):
         item.description = description
     if price:
         try:
-            item.price = float(Decimal(str(price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+            item.price = to_cents(price)
         except Exception:
             return jsonify({'error': 'Invalid price format'}), 400
     
     # Handle file upload
     if 'image' in request.files:
         file = request.files['image']
-        if file and file.filename and allowed_file(file.filename):
-            # Delete old image if exists
+        if file and file.filename and is_image_filename(file.filename):
+            # Save new image, then drop the old one's reference
+            try:
+                image_path = store_image(file)
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 400
             if item.image_path:
-                old_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 
-                                           item.image_path.split('/')[-1])
-                if os.path.exists(old_file_path):
-                    os.remove(old_file_path)
-            
-            # Save new image
-            filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            item.image_path = f'/uploads/{filename}'
+                release_images([item.image_path])
+            item.image_path = image_path
     
+    TeacherStats.bump(current_user.id)
+    db.session.flush()
+    publish_item(current_user.id, 'updated', item.to_dict())
     db.session.commit()
     
     return jsonify({
@@ -234,18 +674,60 @@ def delete_item(item_id):
     if not item:
         return jsonify({'error': 'Item not found'}), 404
     
-    # Delete image file if exists
+    if db.session.query(Item.purchases.any()).filter(Item.id == item.id).scalar():
+        return jsonify({'error': 'Item has been purchased and cannot be deleted'}), 409
+    
+    # The image file is deleted after commit once no other item uses it
     if item.image_path:
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 
-                               item.image_path.split('/')[-1])
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        release_images([item.image_path])
     
     db.session.delete(item)
+    TeacherStats.bump(current_user.id, item_count=-1)
+    publish_item(current_user.id, 'deleted', {'id': item_id})
     db.session.commit()
     
     return jsonify({'message': 'Item deleted successfully'}), 200
 
+@teacher_bp.route('/items/delete', methods=['POST'])
+@login_required
+def delete_items():
+    """Delete several store items in one statement; purchased items are kept and reported"""
+    item_ids = read_id_list(request.get_json(), 'item_ids')
+    
+    if item_ids is None:
+        return jsonify({'error': 'Provide a list of item_ids'}), 400
+    
+    deleted = dict(db.session.execute(
+        db.delete(Item).where(
+            Item.teacher_id == current_user.id, Item.id.in_(item_ids), ~Item.purchases.any()
+        ).returning(Item.id, Item.image_path),
+        execution_options={'synchronize_session': False}
+    ).all())
+    
+    failed = []
+    if item_ids - deleted.keys():
+        purchased = set(db.session.scalars(
+            db.select(Item.id).where(Item.teacher_id == current_user.id, Item.id.in_(item_ids - deleted.keys()))
+        ))
+        for item_id in sorted(item_ids - deleted.keys()):
+            if item_id in purchased:
+                failed.append({'item_id': item_id, 'error': 'Item has been purchased and cannot be deleted'})
+            else:
+                failed.append({'item_id': item_id, 'error': 'Item not found'})
+    
+    if deleted:
+        release_images(image_path for image_path in deleted.values() if image_path)
+        TeacherStats.bump(current_user.id, item_count=-len(deleted))
+        for item_id in deleted:
+            publish_item(current_user.id, 'deleted', {'id': item_id})
+    db.session.commit()
+    
+    return jsonify({
+        'message': f'Deleted {len(deleted)} items',
+        'deleted': sorted(deleted),
+        'failed': failed
+    }), 200
+
 @teacher_bp.route('/students/<int:student_id>/statement', methods=['GET'])
 @login_required
 def generate_statement(student_id):
@@ -255,77 +737,60 @@ def generate_statement(student_id):
     if not student:
         return jsonify({'error': 'Student not found'}), 404
     
-    # Get all transactions for the student
-    transactions = Transaction.query.filter_by(student_id=student.id).order_by(
-        Transaction.created_at.desc()
-    ).all()
+    filename = f'{student.name}_{student.student_id}_statement.csv'
+    header = statement_header(student.name, student.student_id, student.balance)
+    student_id = student.id
     
-    # Get all purchases for the student
-    purchases = db.session.query(Purchase, Item).join(Item).filter(
-        Purchase.student_id == student.id
-    ).order_by(Purchase.created_at.desc()).all()
-    
-    # Create CSV content
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['PSTEP Classroom Bank Statement'])
-    writer.writerow(['Student Name:', student.name])
-    writer.writerow(['Student ID:', student.student_id])
-    balance = Decimal(str(student.balance)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    writer.writerow(['Current Balance:', f'${balance:.2f}'])
-    writer.writerow(['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-    writer.writerow([])  # Empty row
-    
-    # Write transactions header
-    writer.writerow(['Date', 'Type', 'Amount', 'Description', 'Balance After'])
-    
-    # Combine and sort all transactions and purchases by date
-    all_records = []
-    
-    for transaction in transactions:
-        amount = Decimal(str(transaction.amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        all_records.append({
-            'date': transaction.created_at,
-            'type': transaction.type.title(),
-            'amount': f'${amount:.2f}',
-            'description': transaction.description,
-            'balance_after': ''  # We'll calculate this if needed
-        })
-    for purchase, item in purchases:
-        total_amount = Decimal(str(purchase.total_amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        all_records.append({
-            'date': purchase.created_at,
-            'type': 'Purchase',
-            'amount': f'-${total_amount:.2f}',
-            'description': f'Purchased {purchase.quantity}x {item.name}',
-            'balance_after': ''
-        })
-    
-    # Sort by date (newest first)
-    all_records.sort(key=lambda x: x['date'], reverse=True)
-    
-    # Write records
-    for record in all_records:
-        writer.writerow([
-            record['date'].strftime('%Y-%m-%d %H:%M:%S'),
-            record['type'],
-            record['amount'],
-            record['description'],
-            record['balance_after']
-        ])
-    
-    # Create file-like object
-    output.seek(0)
-    file_data = io.BytesIO(output.getvalue().encode('utf-8'))
-    
-    return send_file(
-        file_data,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'{student.name}_{student.student_id}_statement.csv'
-    )
+    def generate():
+        writer = csv.writer(EchoWriter())
+        for row in header:
+            yield writer.writerow(row).encode('utf-8')
+        for record in statement_records(student_id):
+            yield writer.writerow(record).encode('utf-8')
+    
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    set_attachment(response, filename)
+    return response
+
+@teacher_bp.route('/students/statements', methods=['GET'])
+@login_required
+def generate_class_statements():
+    """Download every student's statement as one ZIP, one CSV per student.
+
+    All ledgers are read in a single ordered pass per table and the archive
+    is streamed as it is compressed, so at most one student's statement is
+    in flight at a time.
+    """
+    students = db.session.execute(
+        db.select(Student.id, Student.name, Student.student_id, Student.balance)
+        .where(Student.teacher_id == current_user.id)
+        .order_by(Student.id)
+    ).all()
+    teacher_id = current_user.id
+    filename = f'class_statements_{datetime.now():%Y%m%d}.zip'
+    
+    def generate():
+        transactions, purchases = ledger_selects(db.select(Student.id).where(Student.teacher_id == teacher_id))
+        transactions = LedgerCursor(db.session.execute(transactions.execution_options(yield_per=STATEMENT_BATCH_SIZE)))
+        purchases = LedgerCursor(db.session.execute(purchases.execution_options(yield_per=STATEMENT_BATCH_SIZE)))
+        writer = csv.writer(EchoWriter())
+        buffer = ChunkBuffer()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for student_id, name, student_number, balance in students:
+                entry_name = f'{name}_{student_number}_statement.csv'.replace('/', '_').replace('\\', '_')
+                with archive.open(entry_name, 'w') as entry:
+                    for row in statement_header(name, student_number, balance):
+                        entry.write(writer.writerow(row).encode('utf-8'))
+                    for record in merge_ledger(transactions.rows_for(student_id), purchases.rows_for(student_id)):
+                        entry.write(writer.writerow(record).encode('utf-8'))
+                        if buffer.size >= CHUNK_SIZE:
+                            yield buffer.drain()
+                yield buffer.drain()
+        yield buffer.drain()
+    
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    set_attachment(response, filename)
+    return response
 
 @teacher_bp.route('/students/<int:student_id>', methods=['PUT'])
 @login_required
@@ -336,6 +801,18 @@ def update_student(student_id):
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
+    update_balance = 'amount' in data and 'type' in data
+    if update_balance:
+        transaction_type = data['type']
+        if transaction_type not in ('credit', 'debit'):
+            return jsonify({'error': 'Invalid transaction type'}), 400
+        try:
+            amount = to_cents(data['amount'])
+        except (ArithmeticError, ValueError):
+            return jsonify({'error': 'Invalid amount'}), 400
+        if amount <= 0:
+            return jsonify({'error': 'Amount must be positive'}), 400
+    
     student = Student.query.filter_by(id=student_id, teacher_id=current_user.id).first()
     
     if not student:
@@ -344,43 +821,44 @@ def update_student(student_id):
     # Update student name if provided
     if 'name' in data:
         student.name = data['name']
+        student.data_version = Student.data_version + 1
+        TeacherStats.bump(current_user.id)
     
     # Update balance if amount and type are provided
-    if 'amount' in data and 'type' in data:
-        amount = Decimal(str(data['amount'])).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        transaction_type = data['type']
+    if update_balance:
         description = data.get('description', f'Manual {transaction_type} by teacher')
         
-        student_balance = Decimal(str(student.balance)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        if transaction_type == 'credit':
-            student_balance += amount
-            student.balance = float(student_balance)
-        elif transaction_type == 'debit':
-            if student_balance < amount:
+        new_balance = Student.adjust_balance(student.id, amount if transaction_type == 'credit' else -amount)
+        if new_balance is None:
+            db.session.rollback()
+            if transaction_type == 'debit':
                 return jsonify({'error': 'Insufficient balance'}), 400
-            student_balance -= amount
-            student.balance = float(student_balance)
-        else:
-            return jsonify({'error': 'Invalid transaction type'}), 400
+            return jsonify({'error': 'Student not found'}), 404  # deleted since it was loaded
         
         # Create transaction record
         transaction = Transaction(
             student_id=student.id,
             type=transaction_type,
-            amount=float(amount),
-            description=description
+            amount=amount,
+            description=description,
+            balance_after=new_balance
         )
         
         db.session.add(transaction)
+        TeacherStats.bump(current_user.id, **{f'{transaction_type}s_issued': amount})
+        db.session.flush()
+        publish_balance(student.id, current_user.id, cents_to_float(new_balance), transaction.to_dict())
     
     db.session.commit()
+    if 'name' in data:
+        invalidate_student(student.id)
     
     response_data = {
         'message': 'Student updated successfully',
         'student': student.to_dict()
     }
     
-    if 'amount' in data and 'type' in data:
+    if update_balance:
         response_data['transaction'] = transaction.to_dict()
     
     return jsonify(response_data), 200
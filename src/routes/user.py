@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request
-from src.models.user import User, db
+from src.models.user import User, Student, Item, db
+from src.auth import invalidate_student, invalidate_teacher
+from src.uploads import release_images
 
 user_bp = Blueprint('user', __name__)
 
@@ -29,11 +31,21 @@ def update_user(user_id):
     user.username = data.get('username', user.username)
     user.email = data.get('email', user.email)
     db.session.commit()
+    invalidate_teacher(user_id)
     return jsonify(user.to_dict())
 
 @user_bp.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
+    # Students go by ON DELETE CASCADE; their cached identities are dropped after commit
+    student_ids = db.session.scalars(db.select(Student.id).where(Student.teacher_id == user_id)).all()
+    # Items go by ON DELETE CASCADE, so release their images first
+    release_images(db.session.scalars(
+        db.select(Item.image_path).where(Item.teacher_id == user_id, Item.image_path.is_not(None))
+    ).all())
     db.session.delete(user)
     db.session.commit()
+    invalidate_teacher(user_id)
+    for student_id in student_ids:
+        invalidate_student(student_id)
     return '', 204
@@ -0,0 +1,33 @@
+from sqlalchemy import event
+from src.models.user import db
+
+# Applied to every new SQLite connection. Override with app.config['SQLITE_PRAGMAS']
+# (an empty dict keeps SQLite's defaults).
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',          # readers no longer block on a writer
+    'synchronous': 'NORMAL',        # safe with WAL, no fsync per commit
+    'busy_timeout': 5000,           # ms to wait for a lock before "database is locked"
+    'cache_size': -20000,           # page cache in KiB (20 MB)
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Applied regardless of SQLITE_PRAGMAS: deletes rely on ON DELETE CASCADE
+REQUIRED_SQLITE_PRAGMAS = {
+    'foreign_keys': 'ON',
+}
+
+def init_sqlite_tuning(app):
+    """Install a connect hook that applies the configured pragmas to the app's engine"""
+    pragmas = {**app.config.get('SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS), **REQUIRED_SQLITE_PRAGMAS}
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
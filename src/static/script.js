@@ -135,6 +135,7 @@ async function teacherRegister(event) {
 async function logout() {
     try {
         await fetch(`${API_BASE}/auth/logout`, { method: 'POST' });
+        closeEventStream();
         currentUser = null;
         currentStudent = null;
         cart = {};
@@ -158,6 +159,14 @@ function showTeacherDashboard() {
     document.getElementById('userInfo').style.display = 'flex';
     document.getElementById('userName').textContent = currentUser.username;
     loadTeacherDashboard();
+    openEventStream('teacher', {
+        balance: refreshTeacherDashboardSoon,
+        item: () => {
+            if (document.getElementById('storeTab').classList.contains('active')) {
+                loadItems();
+            }
+        }
+    }, loadTeacherDashboard);
 }
 
 function showStudentDashboard() {
@@ -166,6 +175,14 @@ function showStudentDashboard() {
     document.getElementById('userInfo').style.display = 'flex';
     document.getElementById('userName').textContent = currentStudent.name;
     loadStudentDashboard();
+    openEventStream('student', {
+        balance: applyStudentBalanceEvent,
+        item: () => {
+            if (document.getElementById('studentStoreTab').classList.contains('active')) {
+                loadStore();
+            }
+        }
+    }, loadStudentDashboard);
 }
 
 function hideAllScreens() {
@@ -174,6 +191,82 @@ function hideAllScreens() {
     });
 }
 
+// Live updates over Server-Sent Events
+let eventStream = null;
+let eventPollTimer = null;
+const EVENT_POLL_INTERVAL = 30000;  // ms between reloads while the server has no stream to spare
+
+// Subscribe to /api/<role>/events; `resync` reloads the view after a reconnect
+function openEventStream(role, handlers, resync) {
+    closeEventStream();
+    if (!window.EventSource) {
+        return;
+    }
+    
+    const stream = new EventSource(`${API_BASE}/${role}/events`);
+    let connectedBefore = false;
+    stream.addEventListener('open', () => {
+        // Events sent while disconnected are lost, so reload once we are back
+        if (connectedBefore) {
+            resync();
+        }
+        connectedBefore = true;
+    });
+    stream.addEventListener('error', () => {
+        // A 503 (too many open streams) closes the stream for good: poll, then try streaming again
+        if (stream.readyState === EventSource.CLOSED && eventStream === stream) {
+            eventStream = null;
+            eventPollTimer = setTimeout(() => {
+                eventPollTimer = null;
+                resync();
+                openEventStream(role, handlers, resync);
+            }, EVENT_POLL_INTERVAL);
+        }
+    });
+    Object.entries(handlers).forEach(([name, handler]) => {
+        stream.addEventListener(name, event => handler(JSON.parse(event.data)));
+    });
+    eventStream = stream;
+}
+
+function closeEventStream() {
+    if (eventPollTimer) {
+        clearTimeout(eventPollTimer);
+        eventPollTimer = null;
+    }
+    if (eventStream) {
+        eventStream.close();
+        eventStream = null;
+    }
+}
+
+// Coalesce bursts of balance events into one reload of the students and totals
+let teacherRefreshTimer = null;
+
+function refreshTeacherDashboardSoon() {
+    clearTimeout(teacherRefreshTimer);
+    teacherRefreshTimer = setTimeout(() => {
+        loadTeacherSummary();
+        if (document.getElementById('studentsTab').classList.contains('active')) {
+            loadStudents();
+        }
+    }, 250);
+}
+
+function applyStudentBalanceEvent(data) {
+    document.getElementById('studentBalance').textContent = `${data.balance.toFixed(2)}`;
+    
+    const transactionsList = document.getElementById('transactionsList');
+    // A reload triggered by this same change may already have listed it
+    if (transactionsList.querySelector(`[data-transaction-id="${data.transaction.id}"]`)) {
+        return;
+    }
+    if (!transactionsList.querySelector('.transaction-item')) {
+        transactionsList.innerHTML = '';
+    }
+    transactionsList.prepend(createTransactionItem(data.transaction));
+}
+
 // Tab management
 function switchTab(tab) {
     document.querySelectorAll('.login-tabs .tab-btn').forEach(btn => {
@@ -250,18 +343,22 @@ function showLogin() {
 }
 
 // Teacher dashboard functions
-async function loadTeacherDashboard() {
+function loadTeacherDashboard() {
+    loadTeacherSummary();
+    
+    // Load students by default
+    loadStudents();
+}
+
+async function loadTeacherSummary() {
     try {
-        const response = await fetch(`${API_BASE}/teacher/dashboard`);
+        const response = await fetch(`${API_BASE}/teacher/summary`);
         const data = await response.json();
         
         if (response.ok) {
-            document.getElementById('totalStudents').textContent = data.students.length;
-            document.getElementById('totalItems').textContent = data.items.length;
+            document.getElementById('totalStudents').textContent = data.student_count;
+            document.getElementById('totalItems').textContent = data.item_count;
             document.getElementById('totalRevenue').textContent = `${data.total_revenue.toFixed(2)}`;
-            
-            // Load students by default
-            loadStudents();
         }
     } catch (error) {
         showToast('Failed to load dashboard', 'error');
@@ -270,7 +367,7 @@ async function loadTeacherDashboard() {
 
 async function loadStudents() {
     try {
-        const response = await fetch(`${API_BASE}/teacher/dashboard`);
+        const response = await fetch(`${API_BASE}/teacher/students`);
         const data = await response.json();
         
         if (response.ok) {
@@ -311,7 +408,7 @@ function createStudentCard(student) {
 
 async function loadItems() {
     try {
-        const response = await fetch(`${API_BASE}/teacher/dashboard`);
+        const response = await fetch(`${API_BASE}/teacher/items`);
         const data = await response.json();
         
         if (response.ok) {
@@ -368,16 +465,34 @@ async function loadStudentDashboard() {
     }
 }
 
+// Cursor for the next page of transaction history (null when fully loaded)
+let transactionsCursor = null;
+let transactionsLoading = false;
+
 async function loadStudentAccount() {
+    const transactionsList = document.getElementById('transactionsList');
+    transactionsList.innerHTML = '';
+    transactionsCursor = null;
+    
+    await loadMoreTransactions(true);
+}
+
+async function loadMoreTransactions(firstPage = false) {
+    if (transactionsLoading || (!firstPage && !transactionsCursor)) {
+        return;
+    }
+    
+    transactionsLoading = true;
+    
     try {
-        const response = await fetch(`${API_BASE}/student/transactions`);
+        const params = transactionsCursor ? `?cursor=${encodeURIComponent(transactionsCursor)}` : '';
+        const response = await fetch(`${API_BASE}/student/transactions${params}`);
         const data = await response.json();
         
         if (response.ok) {
             const transactionsList = document.getElementById('transactionsList');
-            transactionsList.innerHTML = '';
             
-            if (data.transactions.length === 0) {
+            if (firstPage && data.transactions.length === 0) {
                 transactionsList.innerHTML = '<p class="text-center">No transactions yet.</p>';
                 return;
             }
@@ -386,24 +501,36 @@ async function loadStudentAccount() {
                 const transactionItem = createTransactionItem(transaction);
                 transactionsList.appendChild(transactionItem);
             });
+            transactionsCursor = data.next_cursor;
         }
     } catch (error) {
         showToast('Failed to load transactions', 'error');
+    } finally {
+        transactionsLoading = false;
     }
 }
 
+// Load further history pages when the list is scrolled near its end
+document.getElementById('transactionsList').addEventListener('scroll', function() {
+    if (this.scrollTop + this.clientHeight >= this.scrollHeight - 50) {
+        loadMoreTransactions();
+    }
+});
+
 function createTransactionItem(transaction) {
     const item = document.createElement('div');
     item.className = `transaction-item transaction-${transaction.type}`;
+    item.dataset.transactionId = transaction.id;
     
     const date = new Date(transaction.created_at).toLocaleDateString();
     const amount = transaction.type === 'credit' ? `+${transaction.amount.toFixed(2)}` : `-${transaction.amount.toFixed(2)}`;
     const transactionType = transaction.type === 'credit' ? 'Deposit' : 'Withdraw';
+    const balanceAfter = transaction.balance_after !== null ? ` - Balance: ${transaction.balance_after.toFixed(2)}` : '';
     
     item.innerHTML = `
         <div class="transaction-info">
             <h4>${transaction.description}</h4>
-            <p>${date} - ${transactionType}</p>
+            <p>${date} - ${transactionType}${balanceAfter}</p>
         </div>
         <div class="transaction-amount ${transaction.type}">${amount}</div>
     `;
@@ -655,6 +782,47 @@ function showAddStudent() {
     showModal('Add New Student', content);
 }
 
+function showImportStudents() {
+    const content = `
+        <form onsubmit="importStudents(event)">
+            <div class="form-group">
+                <label for="rosterFile">Roster CSV (columns: name, student_id, balance)</label>
+                <input type="file" id="rosterFile" accept=".csv,text/csv" required>
+            </div>
+            <button type="submit" class="btn btn-primary">
+                <i class="fas fa-file-import"></i> Import Students
+            </button>
+        </form>
+    `;
+    showModal('Import Students', content);
+}
+
+function showPayClass() {
+    const content = `
+        <form onsubmit="payClass(event)">
+            <div class="form-group">
+                <label for="classTransactionType">Transaction Type</label>
+                <select id="classTransactionType" required>
+                    <option value="deposit">Deposit</option>
+                    <option value="withdraw">Withdraw</option>
+                </select>
+            </div>
+            <div class="form-group">
+                <label for="classAmount">Amount per Student</label>
+                <input type="number" id="classAmount" step="0.01" min="0.01" required>
+            </div>
+            <div class="form-group">
+                <label for="classDescription">Description</label>
+                <input type="text" id="classDescription" placeholder="Payday">
+            </div>
+            <button type="submit" class="btn btn-primary">
+                <i class="fas fa-coins"></i> Apply to All Students
+            </button>
+        </form>
+    `;
+    showModal('Pay Class', content);
+}
+
 function showUpdateBalance(studentId, studentName, currentBalance) {
     const content = `
         <form onsubmit="updateStudent(event, ${studentId})">
@@ -777,7 +945,7 @@ async function addStudent(event) {
             showToast('Student added successfully!', 'success');
             closeModal();
             loadStudents();
-            loadTeacherDashboard();
+            loadTeacherSummary();
         } else {
             showToast(data.error || 'Failed to add student', 'error');
         }
@@ -820,7 +988,6 @@ async function updateStudent(event, studentId) {
             showToast('Student balance updated successfully!', 'success');
             closeModal();
             loadStudents();
-            loadTeacherDashboard();
         } else {
             showToast(responseData.error || 'Failed to update student balance', 'error');
         }
@@ -832,6 +999,53 @@ async function updateStudent(event, studentId) {
     }
 }
 
+async function payClass(event) {
+    event.preventDefault();
+    
+    const type = document.getElementById('classTransactionType').value;
+    const data = {
+        all: true,
+        type: type === 'deposit' ? 'credit' : 'debit',
+        amount: parseFloat(document.getElementById('classAmount').value)
+    };
+    const description = document.getElementById('classDescription').value;
+    if (description) {
+        data.description = description;
+    }
+    
+    showLoading();
+    
+    try {
+        const response = await fetch(`${API_BASE}/teacher/students/balance`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(data)
+        });
+        
+        const responseData = await response.json();
+        
+        if (response.ok) {
+            loadStudents();
+            loadTeacherSummary();
+            if (responseData.failed.length > 0) {
+                const rows = responseData.failed.map(failure => `<li>${failure.name}: ${failure.error} (balance ${failure.available.toFixed(2)})</li>`).join('');
+                showModal('Class Payment Results', `<p>Updated ${responseData.updated.length} students. Skipped:</p><ul>${rows}</ul>`);
+            } else {
+                closeModal();
+                showToast(`Updated ${responseData.updated.length} students!`, 'success');
+            }
+        } else {
+            showToast(responseData.error || 'Failed to update balances', 'error');
+        }
+    } catch (error) {
+        showToast('Network error. Please try again.', 'error');
+    } finally {
+        hideLoading();
+    }
+}
+
 async function addItem(event) {
     event.preventDefault();
     
@@ -859,7 +1073,7 @@ async function addItem(event) {
             showToast('Item added successfully!', 'success');
             closeModal();
             loadItems();
-            loadTeacherDashboard();
+            loadTeacherSummary();
         } else {
             showToast(data.error || 'Failed to add item', 'error');
         }
@@ -870,6 +1084,42 @@ async function addItem(event) {
     }
 }
 
+async function importStudents(event) {
+    event.preventDefault();
+    
+    const formData = new FormData();
+    formData.append('file', document.getElementById('rosterFile').files[0]);
+    
+    showLoading();
+    
+    try {
+        const response = await fetch(`${API_BASE}/teacher/students/import`, {
+            method: 'POST',
+            body: formData
+        });
+        
+        const data = await response.json();
+        
+        if (response.ok) {
+            loadStudents();
+            loadTeacherSummary();
+            if (data.errors.length > 0) {
+                const rows = data.errors.map(error => `<li>Line ${error.line}: ${error.error}</li>`).join('');
+                showModal('Import Results', `<p>Imported ${data.imported} students. Skipped rows:</p><ul>${rows}</ul>`);
+            } else {
+                closeModal();
+                showToast(`Imported ${data.imported} students!`, 'success');
+            }
+        } else {
+            showToast(data.error || 'Failed to import students', 'error');
+        }
+    } catch (error) {
+        showToast('Network error. Please try again.', 'error');
+    } finally {
+        hideLoading();
+    }
+}
+
 async function deleteStudent(studentId) {
     if (!confirm('Are you sure you want to delete this student? This action cannot be undone.')) {
         return;
@@ -885,7 +1135,7 @@ async function deleteStudent(studentId) {
         if (response.ok) {
             showToast('Student deleted successfully', 'success');
             loadStudents();
-            loadTeacherDashboard();
+            loadTeacherSummary();
         } else {
             const data = await response.json();
             showToast(data.error || 'Failed to delete student', 'error');
@@ -912,7 +1162,7 @@ async function deleteItem(itemId) {
         if (response.ok) {
             showToast('Item deleted successfully', 'success');
             loadItems();
-            loadTeacherDashboard();
+            loadTeacherSummary();
         } else {
             const data = await response.json();
             showToast(data.error || 'Failed to delete item', 'error');
@@ -947,6 +1197,11 @@ async function downloadStatement(studentId) {
     }
 }
 
+function downloadClassStatements() {
+    // Plain navigation lets the browser stream the ZIP to disk instead of buffering a blob
+    window.location.href = `${API_BASE}/teacher/students/statements`;
+}
+
 async function updateProfile(event) {
     event.preventDefault();
     
@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from flask import Response
+
+# Served gzipped when the client accepts it and compression actually saves bytes
+COMPRESSIBLE_TYPES = {'application/javascript', 'application/json', 'image/svg+xml', 'image/x-icon',
+                      'image/vnd.microsoft.icon', 'text/javascript'}
+
+class StaticAsset:
+    """One static file held in memory with its metadata and optional gzip variant"""
+
+    def __init__(self, data, mimetype, mtime):
+        self.data = data
+        self.mimetype = mimetype
+        self.mtime = mtime
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+        self.gzipped = None
+        if mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                self.gzipped = compressed
+
+    def respond(self, request):
+        """Build the response for ``request``, negotiating gzip and If-None-Match"""
+        use_gzip = self.gzipped is not None and request.accept_encodings['gzip'] > 0
+        etag = f'{self.etag}-gz' if use_gzip else self.etag  # each encoding is its own representation
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.gzipped if use_gzip else self.data, mimetype=self.mimetype)
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+            response.last_modified = self.mtime
+        response.set_etag(etag)
+        response.cache_control.no_cache = True  # names aren't fingerprinted: revalidate, cheaply
+        if self.gzipped is not None:
+            response.vary.add('Accept-Encoding')
+        return response
+
+class StaticManifest:
+    """Every file under the static folder, loaded once so hits need no filesystem calls.
+
+    ``refresh_if_changed`` rescans file mtimes at most once a second and
+    rebuilds on any change; the app only calls it in debug mode.
+    """
+
+    def __init__(self):
+        self.folder = None
+        self.exclude = ()
+        self._assets = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def build(self, folder, exclude=()):
+        self.folder = folder
+        self.exclude = tuple(os.path.abspath(path) for path in exclude)
+        self._load()
+
+    def get(self, path):
+        return self._assets.get(path)
+
+    def refresh_if_changed(self):
+        now = time.monotonic()
+        if self.folder is None or now - self._checked_at < 1.0:
+            return
+        with self._lock:
+            self._checked_at = now
+            if self._scan() != self._signature:
+                self._load()
+
+    def _scan(self):
+        """{relative path: (mtime_ns, size)} for every file to serve"""
+        signature = {}
+        for root, dirs, files in os.walk(self.folder):
+            dirs[:] = [name for name in dirs if os.path.abspath(os.path.join(root, name)) not in self.exclude]
+            for name in files:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                signature[os.path.relpath(path, self.folder).replace(os.sep, '/')] = (stat.st_mtime_ns, stat.st_size)
+        return signature
+
+    def _load(self):
+        signature = self._scan()
+        assets = {}
+        for relative, (mtime_ns, _) in signature.items():
+            with open(os.path.join(self.folder, relative), 'rb') as f:
+                data = f.read()
+            mimetype = mimetypes.guess_type(relative)[0] or 'application/octet-stream'
+            assets[relative] = StaticAsset(data, mimetype, mtime_ns // 1_000_000_000)
+        self._assets = assets
+        self._signature = signature
+
+static_assets = StaticManifest()
+
+def init_static_assets(app):
+    """Load the static folder (minus uploads, which have their own route) into memory"""
+    if app.static_folder is not None:
+        static_assets.build(app.static_folder, exclude=[app.config['UPLOAD_FOLDER']])
@@ -0,0 +1,29 @@
+"""File-like helpers for streaming CSV, ZIP and gzip responses from generators"""
+
+CHUNK_SIZE = 64 * 1024  # compressed bytes collected before a chunk is handed to the response
+
+class EchoWriter:
+    """File-like object whose write() hands the line back, so csv.writer can feed a generator"""
+    def write(self, value):
+        return value
+
+class ChunkBuffer:
+    """Write-only file object that collects bytes until drained, so zipfile or gzip can feed a generator"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
@@ -0,0 +1,334 @@
+import hashlib
+import logging
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+from flask import Request, abort, current_app, send_from_directory
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.user import db, ImageFile, Item
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of each accepted image format, and the extension it is stored under
+IMAGE_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'\xff\xd8\xff': 'jpg',
+    b'GIF87a': 'gif',
+    b'GIF89a': 'gif',
+}
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+SIGNATURE_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES)
+CONTENT_HASH = re.compile(r'[0-9a-f]{64}')
+
+def is_image_filename(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+class HashingUpload:
+    """Temporary file in UPLOAD_TMP_FOLDER that hashes, sizes and sniffs bytes as they are written.
+
+    Werkzeug's form parser writes image uploads straight into it, so the
+    SHA-256, the size and the format are known once parsing is done, and
+    storing the image is a rename rather than another copy (UPLOAD_TMP_FOLDER
+    is on the same filesystem as UPLOAD_FOLDER, but nothing serves it).
+    Closing it removes the file unless ``claim`` moved it into place.
+    """
+
+    def __init__(self, directory):
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+        self.claimed = False
+
+    def write(self, data):
+        if len(self.head) < SIGNATURE_LENGTH:
+            self.head += bytes(data[:SIGNATURE_LENGTH - len(self.head)])
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def image_extension(self):
+        """Extension of the image format the leading bytes match, or None"""
+        for signature, extension in IMAGE_SIGNATURES.items():
+            if self.head.startswith(signature):
+                return extension
+        return None
+
+    def claim(self, path):
+        """Move the upload to ``path``; if identical content is already there, keep that copy.
+
+        Returns True if a new file was created. Either way the file gets a
+        fresh mtime, so the orphan sweeper's grace period covers it until the
+        commit and the janitor can tell it was claimed again after a release.
+        """
+        self.file.close()
+        self.claimed = True
+        now = time.time_ns()
+        try:
+            os.utime(path, ns=(now, now))
+        except FileNotFoundError:
+            os.replace(self.file.name, path)
+            os.utime(path, ns=(now, now))
+            return True
+        os.remove(self.file.name)
+        return False
+
+    def close(self):
+        self.file.close()
+        if not self.claimed:
+            try:
+                os.remove(self.file.name)
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def copy_of(cls, stream, directory):
+        """Hash an upload that was spooled by another stream factory"""
+        upload = cls(directory)
+        stream.seek(0)
+        shutil.copyfileobj(stream, upload)
+        return upload
+
+class UploadRequest(Request):
+    """Request whose image file uploads are written into HashingUpload files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and is_image_filename(filename):
+            return HashingUpload(current_app.config['UPLOAD_TMP_FOLDER'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+def store_image(file):
+    """Store an uploaded image under its SHA-256 and count the reference.
+
+    Returns the image path for Item.image_path, or raises ValueError if the
+    content isn't a PNG, JPEG or GIF or is larger than MAX_IMAGE_SIZE.
+    """
+    upload = file.stream
+    if not isinstance(upload, HashingUpload):
+        upload = HashingUpload.copy_of(upload, current_app.config['UPLOAD_TMP_FOLDER'])
+    try:
+        extension = upload.image_extension()
+        if extension is None:
+            raise ValueError('File is not a PNG, JPEG or GIF image')
+        if upload.size > current_app.config.get('MAX_IMAGE_SIZE', 5 * 1024 * 1024):
+            raise ValueError('Image is too large')
+        filename = f'{upload.sha256.hexdigest()}.{extension}'
+        # Count the reference before claiming the file: the write lock it takes
+        # keeps a release of the same image from committing until this session ends
+        db.session.execute(
+            sqlite_insert(ImageFile).values(filename=filename, size=upload.size, ref_count=1)
+            .on_conflict_do_update(index_elements=['filename'], set_={'ref_count': ImageFile.ref_count + 1})
+        )
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        if upload.claim(path):
+            # Removed again if the session rolls back instead of committing
+            db.session.info.setdefault('new_image_files', {})[filename] = os.stat(path).st_mtime_ns
+    finally:
+        upload.close()
+    return f'/uploads/{filename}'
+
+def release_images(image_paths):
+    """Drop one reference per path; files no item uses any more are deleted after commit"""
+    released = db.session.info.setdefault('released_image_files', {})
+    for image_path in image_paths:
+        filename = image_path.split('/')[-1]
+        remaining = db.session.execute(
+            db.update(ImageFile).where(ImageFile.filename == filename)
+            .values(ref_count=ImageFile.ref_count - 1)
+            .returning(ImageFile.ref_count)
+        ).scalar()
+        if remaining is not None and remaining <= 0:
+            db.session.execute(db.delete(ImageFile).where(ImageFile.filename == filename, ImageFile.ref_count <= 0))
+            try:
+                released[filename] = os.stat(os.path.join(current_app.config['UPLOAD_FOLDER'], filename)).st_mtime_ns
+            except FileNotFoundError:
+                pass
+
+def discard_upload(filename, unchanged):
+    """Delete ``filename`` from UPLOAD_FOLDER if ``unchanged(stat)`` still holds once it is renamed aside.
+
+    An upload reusing the file restamps it (HashingUpload.claim), possibly
+    before its ImageFile row commits. A claim racing the delete either
+    restamped the file before the rename, so the check fails and the file is
+    put back, or finds it gone and stores its own copy. Returns the size of
+    the deleted file, or None if it was kept or already gone.
+    """
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    doomed = os.path.join(current_app.config['UPLOAD_TMP_FOLDER'], f'.deleting-{filename}')
+    try:
+        os.rename(path, doomed)
+        stat = os.stat(doomed)
+        if unchanged(stat):
+            os.remove(doomed)
+            return stat.st_size
+        os.replace(doomed, path)
+    except FileNotFoundError:
+        pass
+    return None
+
+def delete_image_files(files):
+    """Remove stored images from UPLOAD_FOLDER unless they were claimed again meanwhile.
+
+    ``files`` maps filenames to their mtime (ns) when they were released or
+    rolled back; a file whose ImageFile row is back, or whose mtime moved,
+    is kept.
+    """
+    referenced = set(db.session.scalars(db.select(ImageFile.filename).where(ImageFile.filename.in_(files))))
+    for filename, mtime_ns in files.items():
+        if filename not in referenced:
+            discard_upload(filename, lambda stat, mtime_ns=mtime_ns: stat.st_mtime_ns == mtime_ns)
+
+def sweep_uploads(grace=None):
+    """Remove files in UPLOAD_FOLDER that no item references and return (files, bytes) reclaimed.
+
+    One directory scan against one query of Item.image_path. Files modified
+    in the last ``grace`` seconds (UPLOAD_SWEEP_GRACE) are left alone: they
+    may belong to an upload whose item hasn't committed yet. Deletes go
+    through discard_upload, so a file claimed after the scan is kept, and a
+    leftover ImageFile row is only dropped if its ref_count is the one read
+    before the scan. Files left in UPLOAD_TMP_FOLDER by interrupted uploads
+    go after the same grace period.
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    if grace is None:
+        grace = current_app.config.get('UPLOAD_SWEEP_GRACE', 3600)
+    referenced = {image_path.split('/')[-1] for image_path in db.session.scalars(
+        db.select(Item.image_path).where(Item.image_path.is_not(None)).distinct()
+    )}
+    cutoff = time.time() - grace
+
+    def stale(stat):
+        return stat.st_mtime <= cutoff
+
+    with os.scandir(folder) as entries:
+        candidates = [entry.name for entry in entries
+                      if entry.is_file() and entry.name not in referenced and stale(entry.stat())]
+    ref_counts = dict(db.session.execute(
+        db.select(ImageFile.filename, ImageFile.ref_count).where(ImageFile.filename.in_(candidates))
+    ).all())
+    db.session.commit()  # end the read, so the DELETE below compares ref_count with the latest commit
+    orphans, reclaimed = [], 0
+    for filename in candidates:
+        size = discard_upload(filename, stale)
+        if size is not None:
+            orphans.append(filename)
+            reclaimed += size
+    leftovers = 0
+    with os.scandir(current_app.config['UPLOAD_TMP_FOLDER']) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if not stale(stat):
+                continue
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            leftovers += 1
+            reclaimed += stat.st_size
+    rows = [(filename, ref_counts[filename]) for filename in orphans if filename in ref_counts]
+    if rows:
+        db.session.execute(db.delete(ImageFile).where(db.tuple_(ImageFile.filename, ImageFile.ref_count).in_(rows)))
+        db.session.commit()
+    return len(orphans) + leftovers, reclaimed
+
+class UploadJanitor:
+    """Daemon thread that deletes released image files off the request path.
+
+    Filenames are queued by the session hooks once a commit (or rollback)
+    has settled whether they are still needed. Every ``sweep_interval``
+    seconds the same thread also runs sweep_uploads; 0 disables sweeping.
+    """
+
+    def __init__(self):
+        self.sweep_interval = 24 * 3600
+        self._queue = queue.Queue()
+        self._app = None
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, files):
+        """Queue {filename: mtime_ns} for delete_image_files"""
+        for filename, mtime_ns in files.items():
+            self._queue.put((filename, mtime_ns))
+
+    def _run(self):
+        next_sweep = time.monotonic() + self.sweep_interval if self.sweep_interval else None
+        while True:
+            timeout = None if next_sweep is None else max(0.0, next_sweep - time.monotonic())
+            files = {}
+            try:
+                files.update([self._queue.get(timeout=timeout)])
+                while True:
+                    files.update([self._queue.get_nowait()])
+            except queue.Empty:
+                pass
+            with self._app.app_context():
+                try:
+                    if files:
+                        delete_image_files(files)
+                    if next_sweep is not None and time.monotonic() >= next_sweep:
+                        count, reclaimed = sweep_uploads()
+                        logger.info('Upload sweep removed %d orphaned files (%d bytes)', count, reclaimed)
+                        next_sweep = time.monotonic() + self.sweep_interval
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Upload cleanup failed')
+
+upload_janitor = UploadJanitor()
+
+def _delete_released(session):
+    session.info.pop('new_image_files', None)
+    released = session.info.pop('released_image_files', None)
+    if released:
+        upload_janitor.enqueue(released)
+
+def _delete_uncommitted(session):
+    session.info.pop('released_image_files', None)
+    created = session.info.pop('new_image_files', None)
+    if created:
+        upload_janitor.enqueue(created)
+
+def serve_upload(filename):
+    """Serve a stored image with a year-long, immutable cache lifetime.
+
+    Stored names are never reused for other content (content hashes, or
+    uuid4 names from before), so browsers need not revalidate. Content-hash
+    names double as strong ETags; Range requests are answered by send_file.
+    """
+    if filename.startswith('.'):
+        abort(404)  # never serve hidden files
+    stem = filename.rsplit('.', 1)[0]
+    response = send_from_directory(
+        current_app.config['UPLOAD_FOLDER'], filename,
+        max_age=current_app.config.get('UPLOAD_MAX_AGE', 365 * 24 * 3600),
+        etag=stem if CONTENT_HASH.fullmatch(stem) else True
+    )
+    response.cache_control.immutable = True
+    response.accept_ranges = 'bytes'
+    return response
+
+def init_uploads(app):
+    """Hash image uploads while Werkzeug parses them, serve them cacheably and clean up after them"""
+    app.request_class = UploadRequest
+    app.add_url_rule('/uploads/<path:filename>', 'uploaded_file', serve_upload)
+    upload_janitor.sweep_interval = app.config.get('UPLOAD_SWEEP_INTERVAL', 24 * 3600)
+    upload_janitor.start(app)
+    if not event.contains(db.session, 'after_commit', _delete_released):
+        event.listen(db.session, 'after_commit', _delete_released)
+        event.listen(db.session, 'after_rollback', _delete_uncommitted)
@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask
+from src.models.user import db, User
+from src.auth import init_login_manager
+from src.events import init_events
+from src.passwords import init_password_hasher
+from src.routes.auth import auth_bp
+from src.routes.teacher import teacher_bp
+from src.routes.student import student_bp
+from src.sqlite_tuning import init_sqlite_tuning
+
+@pytest.fixture
+def app(tmp_path):
+    """The API wired up like src.main, on a throwaway SQLite file instead of src/database/app.db"""
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'upload-tmp').mkdir()
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+        UPLOAD_TMP_FOLDER=str(tmp_path / 'upload-tmp'),
+        IDENTITY_CACHE_TTL=0,
+        PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',  # fast hashes; the cost isn't under test
+        PASSWORD_HASH_WORKERS=0,
+    )
+    init_login_manager(app)
+    init_password_hasher(app)
+    init_events(app)
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(teacher_bp, url_prefix='/api/teacher')
+    app.register_blueprint(student_bp, url_prefix='/api/student')
+    db.init_app(app)
+    init_sqlite_tuning(app)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def teacher_client(app):
+    """Test client logged in as a freshly created teacher"""
+    with app.app_context():
+        user = User(username='teacher', role='teacher')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+    client = app.test_client()
+    assert client.post('/api/auth/login', json={'username': 'teacher', 'password': 'password'}).status_code == 200
+    return client
+
+@pytest.fixture
+def login_student(app):
+    """Return a function that logs a new test client in as the given student_id"""
+    def login(student_id):
+        client = app.test_client()
+        assert client.post('/api/auth/login', json={'student_id': student_id}).status_code == 200
+        return client
+    return login
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.models.user import db, Student, Transaction, Purchase
+
+PURCHASES = 300
+TEACHER_DEBITS = 50
+TEACHER_CREDITS = 50
+STARTING_BALANCE = 100  # dollars; less than the purchases and debits together, so some must be refused
+
+def test_concurrent_purchases_and_debits_keep_balance_and_ledger_consistent(app, teacher_client, login_student):
+    student_pk = teacher_client.post(
+        '/api/teacher/students', json={'name': 'Ada', 'student_id': 'S1', 'balance': STARTING_BALANCE}
+    ).get_json()['student']['id']
+    item_id = teacher_client.post('/api/teacher/items', data={'name': 'Pencil', 'price': '1'}).get_json()['item']['id']
+    student = login_student('S1')
+
+    def purchase(_):
+        # The cart is shared by every thread, so a checkout may find it empty or holding several pencils
+        student.post('/api/student/cart', json={'item_id': item_id, 'quantity': 1})
+        return student.post('/api/student/purchase')
+
+    def adjust(transaction_type):
+        return teacher_client.post(f'/api/teacher/students/{student_pk}/balance',
+                                   json={'type': transaction_type, 'amount': 1})
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        futures = [pool.submit(purchase, n) for n in range(PURCHASES)]
+        futures += [pool.submit(adjust, 'debit') for _ in range(TEACHER_DEBITS)]
+        futures += [pool.submit(adjust, 'credit') for _ in range(TEACHER_CREDITS)]
+        responses = [future.result() for future in futures]
+
+    assert all(response.status_code in (200, 400) for response in responses)
+    purchased = [response for response in responses[:PURCHASES] if response.status_code == 200]
+    refused = [response for response in responses if response.get_json().get('error') == 'Insufficient balance']
+    assert purchased and refused
+
+    with app.app_context():
+        balance = db.session.get(Student, student_pk).balance
+        transactions = db.session.scalars(
+            db.select(Transaction).where(Transaction.student_id == student_pk).order_by(Transaction.id)
+        ).all()
+        purchase_total = db.session.query(db.func.sum(Purchase.total_amount)).filter_by(student_id=student_pk).scalar()
+
+    assert balance >= 0
+    # Every change was recorded, and replaying the ledger from the start lands on the stored balance
+    running = STARTING_BALANCE * 100
+    for transaction in transactions:
+        running += transaction.amount if transaction.type == 'credit' else -transaction.amount
+        assert running >= 0
+        assert transaction.balance_after == running
+    assert running == balance
+    assert len(transactions) == len([response for response in responses if response.status_code == 200])
+    assert purchase_total == sum(response.get_json()['total_amount'] * 100 for response in purchased)
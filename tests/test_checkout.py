@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+from src.models.user import db
+import src.routes.student as student_routes
+
+def count_selects(app, client, method, path):
+    """Run one request and return (response, number of SELECT statements it executed)"""
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.open(path, method=method)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, sum(1 for statement in statements if statement.lstrip().upper().startswith('SELECT'))
+
+def fill_cart(teacher_client, login_student, student_id, size):
+    """Log in a new student with a cart of ``size`` different items"""
+    teacher_client.post('/api/teacher/students', json={'name': student_id, 'student_id': student_id, 'balance': 1000})
+    student = login_student(student_id)
+    for n in range(size):
+        item = teacher_client.post('/api/teacher/items', data={'name': f'{student_id} item {n}', 'price': '1.25'})
+        assert item.status_code == 201
+        response = student.post('/api/student/cart', json={'item_id': item.get_json()['item']['id'], 'quantity': 2})
+        assert response.status_code == 200
+    return student
+
+def test_cart_and_checkout_query_count_is_independent_of_cart_size(app, teacher_client, login_student):
+    small = fill_cart(teacher_client, login_student, 'small', 1)
+    large = fill_cart(teacher_client, login_student, 'large', 25)
+
+    small_cart, small_cart_selects = count_selects(app, small, 'GET', '/api/student/cart')
+    large_cart, large_cart_selects = count_selects(app, large, 'GET', '/api/student/cart')
+    assert len(small_cart.get_json()['cart_items']) == 1
+    assert len(large_cart.get_json()['cart_items']) == 25
+    assert large_cart_selects == small_cart_selects
+
+    small_purchase, small_purchase_selects = count_selects(app, small, 'POST', '/api/student/purchase')
+    large_purchase, large_purchase_selects = count_selects(app, large, 'POST', '/api/student/purchase')
+    assert small_purchase.status_code == 200
+    assert large_purchase.status_code == 200
+    assert len(large_purchase.get_json()['purchases']) == 25
+    assert large_purchase.get_json()['total_amount'] == 62.5
+    assert large_purchase_selects == small_purchase_selects
+
+def test_checkout_keeps_cart_lines_another_tab_added_after_pricing(app, teacher_client, login_student, monkeypatch):
+    student = fill_cart(teacher_client, login_student, 'tabs', 1)
+    pencil = student.get('/api/student/cart').get_json()['cart_items'][0]['item']
+    eraser = teacher_client.post('/api/teacher/items', data={'name': 'Eraser', 'price': '3'}).get_json()['item']
+    other_tab = login_student('tabs')
+
+    load_cart = student_routes.load_cart
+    def load_cart_then_other_tab_adds(current):
+        cart = load_cart(current)
+        monkeypatch.setattr(student_routes, 'load_cart', load_cart)
+        # Another thread, so the other tab gets its own app context and session
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            added = pool.submit(lambda: [
+                other_tab.post('/api/student/cart', json={'item_id': pencil['id'], 'quantity': 1}).status_code,
+                other_tab.post('/api/student/cart', json={'item_id': eraser['id']}).status_code
+            ]).result()
+        assert added == [200, 200]
+        return cart
+    monkeypatch.setattr(student_routes, 'load_cart', load_cart_then_other_tab_adds)
+
+    response = student.post('/api/student/purchase')
+    assert response.status_code == 200
+    assert response.get_json()['total_amount'] == 2.5  # the two pencils that were in the cart when it was priced
+    cart = {line['item']['name']: line['quantity'] for line in student.get('/api/student/cart').get_json()['cart_items']}
+    assert cart == {pencil['name']: 1, 'Eraser': 1}
+
+def test_cart_rejects_quantities_that_are_not_positive_whole_numbers(teacher_client, login_student):
+    student = fill_cart(teacher_client, login_student, 'bad', 1)
+    item_id = student.get('/api/student/cart').get_json()['cart_items'][0]['item']['id']
+    for quantity in (-3, 0, 1.5, '2', True, None):
+        assert student.post('/api/student/cart', json={'item_id': item_id, 'quantity': quantity}).status_code == 400
+    for quantity in (1.5, '2', True):
+        assert student.put(f'/api/student/cart/{item_id}', json={'quantity': quantity}).status_code == 400
+    cart = student.get('/api/student/cart').get_json()
+    assert [line['quantity'] for line in cart['cart_items']] == [2]
+    assert cart['total'] == 2.5
@@ -0,0 +1,20 @@
+from src.events import broker
+
+def test_streams_over_the_cap_get_503_until_one_closes(teacher_client, monkeypatch):
+    monkeypatch.setattr(broker, 'max_streams', 2)
+    monkeypatch.setattr(broker, 'retry_after', 7)
+    streams = [teacher_client.get('/api/teacher/events', buffered=False) for _ in range(2)]
+    assert [stream.status_code for stream in streams] == [200, 200]
+    assert next(streams[0].response) == b'retry: 3000\n\n'
+
+    refused = teacher_client.get('/api/teacher/events')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '7'
+    assert 'error' in refused.get_json()
+
+    streams[0].close()
+    reopened = teacher_client.get('/api/teacher/events', buffered=False)
+    assert reopened.status_code == 200
+    for stream in (streams[1], reopened):
+        stream.close()
+    assert broker._open_streams == 0
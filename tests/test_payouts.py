@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+from src.models.user import db, Student, Transaction, Payout, PayoutRun
+from src.payouts import run_payout, run_due_payouts
+
+BALANCES = {'S1': 10, 'S2': 0.05, 'S3': 123.45}
+
+@pytest.fixture
+def student_pks(teacher_client):
+    return {
+        student_id: teacher_client.post(
+            '/api/teacher/students', json={'name': student_id, 'student_id': student_id, 'balance': balance}
+        ).get_json()['student']['id']
+        for student_id, balance in BALANCES.items()
+    }
+
+def add_payout(teacher_client, **fields):
+    response = teacher_client.post('/api/teacher/payouts', json=fields)
+    assert response.status_code == 201
+    return response.get_json()['payout']['id']
+
+def ledger(app):
+    with app.app_context():
+        runs = db.session.scalars(db.select(PayoutRun)).all()
+        transactions = db.session.scalars(db.select(Transaction)).all()
+        return [run.students_paid for run in runs], sorted((t.student_id, t.amount, t.balance_after) for t in transactions)
+
+def test_interest_is_floored_per_student_and_skips_zero(app, teacher_client, student_pks):
+    add_payout(teacher_client, kind='interest', rate=2)
+    with app.app_context():
+        loaded = db.session.get(Student, student_pks['S3'])
+        assert loaded.balance == 12345
+        [run] = run_due_payouts(datetime.utcnow() + timedelta(seconds=1))
+        assert run.students_paid == 2
+        assert run.total_amount == 20 + 246
+        # The balance already loaded in this session is not stale after the bulk UPDATE
+        assert loaded.balance == 12345 + 246
+    runs, transactions = ledger(app)
+    assert transactions == sorted([(student_pks['S1'], 20, 1020), (student_pks['S3'], 246, 12591)])
+    students = {student['student_id']: student['balance'] for student in teacher_client.get('/api/teacher/students').get_json()['students']}
+    assert students == {'S1': 10.2, 'S2': 0.05, 'S3': 125.91}
+
+def test_due_payout_runs_once_per_period(app, teacher_client, student_pks):
+    add_payout(teacher_client, kind='allowance', amount=1.5)
+    now = datetime.utcnow() + timedelta(seconds=1)
+    with app.app_context():
+        assert len(run_due_payouts(now)) == 1
+        assert run_due_payouts(now) == []
+    runs, transactions = ledger(app)
+    assert runs == [3]
+    assert sorted(student_id for student_id, _, _ in transactions) == sorted(student_pks.values())
+
+@pytest.mark.parametrize('kind, fields', [('allowance', {'amount': 1.5}), ('interest', {'rate': 2})])
+def test_concurrent_runs_of_one_period_pay_once(app, teacher_client, student_pks, kind, fields):
+    payout_id = add_payout(teacher_client, kind=kind, **fields)
+    now = datetime.utcnow() + timedelta(seconds=1)
+    both_loaded = threading.Barrier(2)
+
+    def pay():
+        with app.app_context():
+            payout = db.session.get(Payout, payout_id)
+            both_loaded.wait()
+            return run_payout(payout, now) is not None
+
+    with ThreadPoolExecutor(2) as pool:
+        paid = list(pool.map(lambda _: pay(), range(2)))
+    assert sorted(paid) == [False, True]
+    runs, transactions = ledger(app)
+    assert len(runs) == 1
+    paid_students = [student_id for student_id, _, _ in transactions]
+    assert sorted(paid_students) == sorted(set(paid_students))
+    assert len(paid_students) == runs[0]
@@ -0,0 +1,29 @@
+import pytest
+
+@pytest.fixture
+def student_pk(teacher_client):
+    return teacher_client.post(
+        '/api/teacher/students', json={'name': 'Ada', 'student_id': 'S1', 'balance': 10}
+    ).get_json()['student']['id']
+
+@pytest.mark.parametrize('method, path', [('POST', '/api/teacher/students/{}/balance'),
+                                          ('PUT', '/api/teacher/students/{}')])
+@pytest.mark.parametrize('transaction_type, amount', [('credit', -5), ('credit', 0), ('debit', -5),
+                                                      ('credit', 'ten'), ('refund', 5)])
+def test_balance_change_rejects_invalid_amount_or_type(teacher_client, student_pk, method, path, transaction_type, amount):
+    response = teacher_client.open(path.format(student_pk), method=method, json={'type': transaction_type, 'amount': amount})
+    assert response.status_code == 400
+    students = teacher_client.get('/api/teacher/students').get_json()['students']
+    assert students[0]['balance'] == 10
+    assert teacher_client.get('/api/teacher/summary').get_json()['credits_issued'] == 0
+
+@pytest.mark.parametrize('method, path', [('POST', '/api/teacher/students/{}/balance'),
+                                          ('PUT', '/api/teacher/students/{}')])
+def test_balance_change_records_transaction(teacher_client, student_pk, method, path):
+    response = teacher_client.open(path.format(student_pk), method=method, json={'type': 'credit', 'amount': 2.5})
+    assert response.status_code == 200
+    assert response.get_json()['student']['balance'] == 12.5
+    assert response.get_json()['transaction']['balance_after'] == 12.5
+    response = teacher_client.open(path.format(student_pk), method=method, json={'type': 'debit', 'amount': 20})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Insufficient balance'
@@ -0,0 +1,153 @@
+import io
+import os
+import threading
+import time
+import pytest
+from werkzeug.datastructures import FileStorage
+import src.uploads as uploads
+from src.models.user import db, ImageFile, Item
+from src.uploads import UploadJanitor, delete_image_files, init_uploads, store_image, sweep_uploads
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'pixels' * 100
+
+@pytest.fixture
+def janitor(app, monkeypatch):
+    """A janitor of this test's own, started by init_uploads before any request"""
+    janitor = UploadJanitor()
+    monkeypatch.setattr(uploads, 'upload_janitor', janitor)
+    app.config['UPLOAD_SWEEP_INTERVAL'] = 0
+    init_uploads(app)
+    return janitor
+
+@pytest.fixture
+def client(janitor, teacher_client):
+    return teacher_client
+
+def add_item(client, image=PNG):
+    response = client.post('/api/teacher/items', content_type='multipart/form-data',
+                           data={'name': 'Sticker', 'price': '1', 'image': (io.BytesIO(image), 'sticker.png')})
+    assert response.status_code == 201
+    return response.get_json()['item']
+
+def upload_path(app, image_path):
+    return os.path.join(app.config['UPLOAD_FOLDER'], image_path.split('/')[-1])
+
+def ref_count(app, filename):
+    with app.app_context():
+        return db.session.scalar(db.select(ImageFile.ref_count).where(ImageFile.filename == filename))
+
+def wait_until_gone(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not os.path.exists(path)
+
+def run_in_thread(target):
+    """Run ``target`` with a session of its own, as another request would"""
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+
+def test_janitor_deletes_image_once_last_item_releases_it(app, client):
+    first, second = add_item(client), add_item(client)
+    assert first['image_path'] == second['image_path']
+    path = upload_path(app, first['image_path'])
+    assert ref_count(app, os.path.basename(path)) == 2
+
+    assert client.delete(f"/api/teacher/items/{first['id']}").status_code == 200
+    assert ref_count(app, os.path.basename(path)) == 1
+    assert client.delete(f"/api/teacher/items/{second['id']}").status_code == 200
+    assert wait_until_gone(path)
+    assert ref_count(app, os.path.basename(path)) is None
+    assert os.listdir(app.config['UPLOAD_TMP_FOLDER']) == []
+
+def test_rollback_removes_new_file_but_keeps_shared_one(app, client):
+    shared = upload_path(app, add_item(client)['image_path'])
+    with app.app_context():
+        new_image_path = store_image(FileStorage(io.BytesIO(PNG + b'new'), 'new.png'))
+        store_image(FileStorage(io.BytesIO(PNG), 'same.png'))
+        db.session.rollback()
+    assert wait_until_gone(upload_path(app, new_image_path))
+    assert os.path.exists(shared)
+    assert ref_count(app, os.path.basename(shared)) == 1
+
+def test_reclaim_before_janitor_runs_keeps_the_file(app, client, janitor, monkeypatch):
+    """An upload of the same image, still uncommitted when the janitor gets to the released file"""
+    released = {}
+    monkeypatch.setattr(janitor, 'enqueue', released.update)
+    item = add_item(client)
+    path = upload_path(app, item['image_path'])
+    assert client.delete(f"/api/teacher/items/{item['id']}").status_code == 200
+    assert list(released) == [os.path.basename(path)]
+
+    stored, janitor_done = threading.Event(), threading.Event()
+
+    def reclaim():
+        with app.app_context():
+            store_image(FileStorage(io.BytesIO(PNG), 'again.png'))
+            stored.set()
+            janitor_done.wait(5)
+            db.session.commit()
+
+    thread = threading.Thread(target=reclaim)
+    thread.start()
+    assert stored.wait(5)
+    with app.app_context():
+        delete_image_files(released)
+    janitor_done.set()
+    thread.join()
+    assert os.path.exists(path)
+    assert ref_count(app, os.path.basename(path)) == 1
+
+def test_sweep_spares_recent_and_referenced_files(app, client):
+    referenced = upload_path(app, add_item(client)['image_path'])
+    folder, tmp_folder = app.config['UPLOAD_FOLDER'], app.config['UPLOAD_TMP_FOLDER']
+    old = time.time() - 7200
+    for name in ('old.png', 'recent.png'):
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(PNG)
+    with open(os.path.join(tmp_folder, '.upload-interrupted'), 'wb') as f:
+        f.write(PNG)
+    for path in (referenced, os.path.join(folder, 'old.png'), os.path.join(tmp_folder, '.upload-interrupted')):
+        os.utime(path, (old, old))
+    with app.app_context():
+        db.session.add(ImageFile(filename='old.png', size=len(PNG), ref_count=1))
+        db.session.commit()
+        assert sweep_uploads(grace=3600) == (2, 2 * len(PNG))
+    assert sorted(os.listdir(folder)) == sorted([os.path.basename(referenced), 'recent.png'])
+    assert os.listdir(tmp_folder) == []
+    assert ref_count(app, 'old.png') is None
+
+@pytest.mark.parametrize('reclaimed', ['before_discard', 'after_discard'])
+def test_sweep_keeps_image_reclaimed_during_the_sweep(app, client, monkeypatch, reclaimed):
+    """An upload of a file the sweep found stale: restamped in time it is kept, else it is stored again"""
+    image_path = add_item(client)['image_path']
+    filename = os.path.basename(image_path)
+    with app.app_context():
+        # An item that went away without releasing its image leaves a stale row
+        db.session.execute(db.update(Item).values(image_path=None))
+        db.session.commit()
+    old = time.time() - 7200
+    os.utime(upload_path(app, image_path), (old, old))
+
+    def reclaim():
+        with app.app_context():
+            store_image(FileStorage(io.BytesIO(PNG), 'again.png'))
+            db.session.commit()
+
+    discard_upload = uploads.discard_upload
+
+    def racing_discard(name, unchanged):
+        if reclaimed == 'before_discard':
+            run_in_thread(reclaim)
+        size = discard_upload(name, unchanged)
+        if reclaimed == 'after_discard':
+            run_in_thread(reclaim)
+        return size
+
+    monkeypatch.setattr(uploads, 'discard_upload', racing_discard)
+    with app.app_context():
+        swept = sweep_uploads(grace=3600)
+    assert swept == ((0, 0) if reclaimed == 'before_discard' else (1, len(PNG)))
+    assert os.path.exists(upload_path(app, image_path))
+    assert ref_count(app, filename) == 2